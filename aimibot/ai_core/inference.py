@@ -0,0 +1,393 @@
+# -*- coding: utf-8 -*-
+
+"""
+Executor de Inferência - AimiBOT
+
+Este módulo tira a geração de texto do LLM de dentro do event loop do bot.
+Ele é responsável por:
+1. Manter um pool de workers, cada um com sua própria thread e sua própria
+   instância do modelo `ctransformers` (os pesos são mapeados com mmap, então
+   a memória dos pesos é compartilhada entre as instâncias).
+2. Controlar a admissão com uma fila limitada: com a fila cheia, o pedido é
+   recusado na hora em vez de acumular espera infinita.
+3. Aplicar um prazo (deadline) a cada pedido, contando o tempo na fila.
+4. Informar a posição na fila para que o usuário receba um feedback.
+5. Direcionar cada pedido, quando possível, ao worker que já tem o mesmo
+   prefixo de prompt avaliado (afinidade), para reaproveitar o KV cache.
+6. Rodar tarefas de baixa prioridade (ex: resumos) só com a fila ociosa,
+   interrompendo-as assim que um pedido ao vivo precisar de um worker.
+7. Separar os pedidos em filas por tier (plano do usuário), com retirada
+   justa ponderada: tiers com peso maior são atendidos mais vezes, mas nenhum
+   tier fica parado para sempre. Cada tier pode ter um modelo próprio.
+
+O código C do `ctransformers` libera o GIL durante a avaliação, então threads
+bastam para manter todos os núcleos ocupados enquanto o bot continua respondendo.
+"""
+
+import asyncio
+import logging
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# --- Configuração do Logging ---
+logger = logging.getLogger(__name__)
+
+
+class InferenceQueueFull(Exception):
+    """A fila de inferência está cheia e o pedido foi recusado."""
+
+
+class InferenceTimeout(Exception):
+    """O pedido não foi concluído dentro do prazo definido."""
+
+
+class InferencePreempted(Exception):
+    """A tarefa de segundo plano foi interrompida para dar lugar a um pedido ao vivo."""
+
+
+# A cada quantos pedidos atendidos as métricas por tier vão para o log.
+STATS_LOG_INTERVAL = 100
+
+
+class _Job:
+    """Um pedido de inferência aguardando (ou em) execução."""
+
+    def __init__(self, fn, deadline: float, affinity=None, background: bool = False, tier=None):
+        self.fn = fn
+        self.deadline = deadline
+        self.affinity = tuple(affinity or ())
+        self.background = background
+        self.tier = tier
+        self.abandoned = False
+        self.future = asyncio.get_running_loop().create_future()
+        # Sinaliza para a função em execução que ela deve parar o quanto antes.
+        self.cancel_event = threading.Event()
+        self.enqueued_at = time.monotonic()
+
+
+class _Tier:
+    """Fila de um tier de usuários, com seu peso e suas métricas."""
+
+    def __init__(self, name: str, weight: float, model_key=None):
+        self.name = name
+        self.weight = max(weight, 0.01)
+        self.model_key = model_key
+        self.queue = deque()
+        # Tempo virtual da retirada justa: cresce 1/peso a cada pedido atendido.
+        self.virtual_time = 0.0
+        self.served = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.recent_waits = deque(maxlen=500)
+
+    def stats(self) -> dict:
+        waits = sorted(self.recent_waits)
+        return {
+            "queued": len(self.queue),
+            "served": self.served,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "avg_wait": sum(waits) / len(waits) if waits else 0.0,
+            "p95_wait": waits[math.ceil(len(waits) * 0.95) - 1] if waits else 0.0,
+            "max_wait": waits[-1] if waits else 0.0
+        }
+
+
+class _Worker:
+    """Uma thread dedicada que possui sua própria instância do modelo."""
+
+    def __init__(self, index: int, model_key=None):
+        self.index = index
+        self.model_key = model_key
+        self.thread_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"aimi-llm-{index}")
+        self.model = None
+        self.busy = False
+        self.job = None
+        # Chaves do último contexto avaliado por este worker (o contexto "vivo" do modelo).
+        self.affinity = frozenset()
+        self.last_used = 0.0
+
+
+class InferenceExecutor:
+    """
+    Pool de workers de inferência com fila limitada e prazos por pedido.
+
+    As funções submetidas recebem `(model, cancel_event)` e rodam na thread do
+    worker. Elas devem checar `cancel_event` periodicamente (ex: a cada token)
+    para liberar o worker assim que o pedido expirar ou for cancelado.
+
+    Args:
+        model_factory: `model_factory(model_key)` cria uma instância do modelo;
+            `model_key=None` é o modelo padrão.
+        workers: Número de workers com o modelo padrão.
+        max_queue: Tamanho máximo da fila de cada tier.
+        request_timeout: Prazo padrão de cada pedido, em segundos.
+        tiers: `{nome: {"weight": peso, "model": chave_do_modelo}}`. Sem tiers, há um único tier "default".
+        default_tier: Tier usado quando o pedido não informa um tier conhecido.
+        model_workers: `{chave_do_modelo: quantidade}` de workers extras com modelos alternativos.
+    """
+
+    def __init__(self, model_factory, workers: int, max_queue: int, request_timeout: float,
+                 tiers: dict | None = None, default_tier: str = "default", model_workers: dict | None = None):
+        self._model_factory = model_factory
+        self._workers = [_Worker(i) for i in range(max(1, workers))]
+        for model_key, count in (model_workers or {}).items():
+            self._workers += [_Worker(len(self._workers), model_key) for _ in range(count)]
+        self._max_queue = max_queue
+        self._request_timeout = request_timeout
+        tiers = tiers or {default_tier: {"weight": 1}}
+        self._tiers = {
+            name: _Tier(name, options.get("weight", 1), options.get("model"))
+            for name, options in tiers.items()
+        }
+        self._default_tier = self._tiers.get(default_tier) or next(iter(self._tiers.values()))
+        self._virtual_clock = 0.0
+        self._background = deque()
+
+    # --- Estado do Pool ---
+
+    def queue_depth(self) -> int:
+        """Número de pedidos ao vivo aguardando um worker livre (somando todos os tiers)."""
+        return sum(len(t.queue) for t in self._tiers.values())
+
+    def tier_stats(self) -> dict:
+        """Métricas por tier: tamanho da fila, atendidos, recusados e tempos de espera."""
+        return {name: tier.stats() for name, tier in self._tiers.items()}
+
+    def busy_workers(self) -> int:
+        """Número de workers executando um pedido neste momento."""
+        return sum(1 for w in self._workers if w.busy)
+
+    # --- API Pública ---
+
+    async def start(self, warmup=None) -> list:
+        """
+        Carrega o modelo em todos os workers em paralelo e, opcionalmente, aquece cada um.
+
+        Args:
+            warmup: Função `warmup(model, worker_index)` executada na thread de cada
+                worker logo após o carregamento. Pode retornar as chaves de afinidade
+                do contexto que deixou avaliado no modelo.
+
+        Returns:
+            Lista `(tempo_de_carga, tempo_de_aquecimento)` em segundos, por worker.
+        """
+        loop = asyncio.get_running_loop()
+        return await asyncio.gather(*(
+            loop.run_in_executor(worker.thread_pool, self._start_worker, worker, warmup)
+            for worker in self._workers
+        ))
+
+    async def submit(self, fn, *, timeout: float | None = None, on_queued=None, affinity=None, tier: str | None = None):
+        """
+        Agenda `fn(model, cancel_event)` em um worker e aguarda o resultado.
+
+        Args:
+            fn: Função bloqueante que será executada na thread do worker.
+            timeout: Prazo total (fila + execução) em segundos. Usa o padrão do pool se omitido.
+            on_queued: Corrotina opcional chamada com a posição na fila quando o
+                pedido não pode começar imediatamente.
+            affinity: Lista opcional de chaves do contexto que o pedido reaproveita,
+                em ordem de preferência. Se algum worker livre já tiver avaliado uma
+                dessas chaves, ele é o escolhido.
+            tier: Tier do pedido (ex: o plano do usuário). Define a fila e o modelo usados.
+
+        Raises:
+            InferenceQueueFull: Se a fila do tier estiver cheia.
+            InferenceTimeout: Se o prazo expirar antes do fim da execução.
+        """
+        tier = self._tiers.get(tier, self._default_tier)
+        if len(tier.queue) >= self._max_queue:
+            tier.rejected += 1
+            logger.warning(f"[Inference] Fila do tier '{tier.name}' cheia ({len(tier.queue)} pedidos). Pedido recusado.")
+            raise InferenceQueueFull()
+
+        timeout = timeout or self._request_timeout
+        job = _Job(fn, time.monotonic() + timeout, affinity, tier=tier)
+        if not tier.queue:
+            # Um tier que estava ocioso não acumula "crédito" do tempo parado.
+            tier.virtual_time = max(tier.virtual_time, self._virtual_clock)
+        tier.queue.append(job)
+        self._dispatch()
+        if job in tier.queue:
+            self._preempt_background()
+
+        try:
+            if job in tier.queue and on_queued:
+                try:
+                    await on_queued(tier.queue.index(job) + 1)
+                except Exception as e:
+                    # O aviso é só cortesia (ex: o Telegram pediu para esperar): o pedido segue na fila.
+                    logger.warning(f"[Inference] Falha ao avisar a posição na fila: {e}")
+            remaining = max(0.0, job.deadline - time.monotonic())
+            return await asyncio.wait_for(asyncio.shield(job.future), timeout=remaining)
+        except asyncio.TimeoutError:
+            self._abandon(job)
+            tier.timed_out += 1
+            logger.warning(f"[Inference] Pedido do tier '{tier.name}' excedeu o prazo de {timeout}s.")
+            raise InferenceTimeout()
+        except asyncio.CancelledError:
+            self._abandon(job)
+            raise
+
+    async def submit_background(self, fn):
+        """
+        Agenda uma tarefa de baixa prioridade, sem prazo, que só começa quando
+        não há nenhum pedido ao vivo na fila.
+
+        Raises:
+            InferencePreempted: Se a tarefa foi interrompida por um pedido ao vivo.
+                Quem chamou pode tentar de novo mais tarde.
+        """
+        job = _Job(fn, float("inf"), background=True)
+        self._background.append(job)
+        self._dispatch()
+        try:
+            return await asyncio.shield(job.future)
+        except asyncio.CancelledError:
+            self._abandon(job)
+            raise
+
+    def shutdown(self):
+        """Encerra as threads dos workers (os pedidos em execução terminam normalmente)."""
+        for queue in (*(t.queue for t in self._tiers.values()), self._background):
+            for job in queue:
+                job.cancel_event.set()
+            queue.clear()
+        for worker in self._workers:
+            worker.thread_pool.shutdown(wait=False)
+
+    # --- Agendamento Interno ---
+
+    def _abandon(self, job: _Job):
+        """Marca o pedido como abandonado e o retira da fila se ainda não começou."""
+        job.abandoned = True
+        job.cancel_event.set()
+        queue = self._background if job.background else job.tier.queue
+        try:
+            queue.remove(job)
+        except ValueError:
+            pass  # Já estava em execução: o worker vai parar ao ver o cancel_event.
+
+    def _preempt_background(self):
+        """Interrompe uma tarefa de segundo plano em execução para liberar um worker."""
+        for worker in self._workers:
+            if worker.busy and worker.job.background and not worker.job.cancel_event.is_set():
+                logger.debug(f"[Inference] Interrompendo tarefa de segundo plano no worker {worker.index}.")
+                worker.job.cancel_event.set()
+                return
+
+    def _dispatch(self):
+        """Entrega pedidos das filas aos workers livres."""
+        loop = asyncio.get_running_loop()
+        while True:
+            idle_workers = [w for w in self._workers if not w.busy]
+            if not idle_workers:
+                return
+            job = self._next_job(idle_workers)
+            if job is None:
+                return
+            worker = self._pick_worker(idle_workers, job)
+            worker.busy = True
+            worker.job = job
+            worker.affinity = frozenset(job.affinity)
+            wait_time = time.monotonic() - job.enqueued_at
+            if job.tier is not None:
+                self._record_dispatch(job.tier, wait_time)
+            logger.debug(f"[Inference] Worker {worker.index} assumiu um pedido após {wait_time:.2f}s na fila.")
+            run = loop.run_in_executor(worker.thread_pool, self._run_job, worker, job)
+            run.add_done_callback(lambda fut, w=worker, j=job: self._on_job_done(w, j, fut))
+
+    def _pick_worker(self, idle_workers: list, job: _Job) -> _Worker:
+        """
+        Escolhe o worker livre para o pedido, entre os que têm o modelo do tier:
+        de preferência um que já tenha o mesmo contexto avaliado; senão, o que
+        está parado há mais tempo.
+        """
+        model_key = job.tier.model_key if job.tier else None
+        candidates = [w for w in idle_workers if w.model_key == model_key]
+        for key in job.affinity:
+            for worker in candidates:
+                if key in worker.affinity:
+                    return worker
+        return min(candidates, key=lambda w: w.last_used)
+
+    def _next_job(self, idle_workers: list) -> _Job | None:
+        """
+        Retira o próximo pedido válido pela retirada justa ponderada: entre os tiers
+        com pedidos (e com um worker livre do seu modelo), sai o de menor tempo virtual.
+        Tarefas de segundo plano só saem quando não há nenhum pedido ao vivo esperando.
+        """
+        idle_models = {w.model_key for w in idle_workers}
+        for tier in sorted(self._tiers.values(), key=lambda t: t.virtual_time):
+            if tier.model_key not in idle_models:
+                continue
+            job = self._pop_valid(tier.queue)
+            if job is not None:
+                return job
+        if self.queue_depth() or None not in idle_models:
+            return None
+        return self._pop_valid(self._background)
+
+    def _pop_valid(self, queue: deque) -> _Job | None:
+        while queue:
+            job = queue.popleft()
+            if job.cancel_event.is_set() or job.future.done():
+                continue
+            if time.monotonic() >= job.deadline:
+                job.future.set_exception(InferenceTimeout())
+                continue
+            return job
+        return None
+
+    def _record_dispatch(self, tier: _Tier, wait_time: float):
+        """Avança o tempo virtual do tier e registra as métricas de espera."""
+        self._virtual_clock = tier.virtual_time
+        tier.virtual_time += 1 / tier.weight
+        tier.served += 1
+        tier.recent_waits.append(wait_time)
+        if sum(t.served for t in self._tiers.values()) % STATS_LOG_INTERVAL == 0:
+            for name, stats in self.tier_stats().items():
+                logger.info(
+                    f"[Inference Stats] Tier '{name}': fila={stats['queued']}, atendidos={stats['served']}, "
+                    f"recusados={stats['rejected']}, espera média={stats['avg_wait']:.2f}s, "
+                    f"p95={stats['p95_wait']:.2f}s, máx={stats['max_wait']:.2f}s"
+                )
+
+    def _start_worker(self, worker: _Worker, warmup) -> tuple:
+        """Executado na thread do worker: carrega o modelo e roda o aquecimento."""
+        started = time.monotonic()
+        if worker.model is None:
+            worker.model = self._model_factory(worker.model_key)
+        loaded = time.monotonic()
+        if warmup:
+            worker.affinity = frozenset(warmup(worker.model, worker.index) or ())
+        return loaded - started, time.monotonic() - loaded
+
+    def _run_job(self, worker: _Worker, job: _Job):
+        """Executado na thread do worker: carrega o modelo (se preciso) e roda o pedido."""
+        if worker.model is None:
+            logger.info(f"[Inference] Worker {worker.index} carregando sua instância do modelo...")
+            worker.model = self._model_factory(worker.model_key)
+        return job.fn(worker.model, job.cancel_event)
+
+    def _on_job_done(self, worker: _Worker, job: _Job, run: asyncio.Future):
+        """Callback no event loop: publica o resultado e libera o worker."""
+        worker.busy = False
+        worker.job = None
+        worker.last_used = time.monotonic()
+        if job.future.done():
+            pass
+        elif job.abandoned:
+            job.future.cancel()  # Ninguém mais aguarda este resultado.
+        elif job.background and job.cancel_event.is_set():
+            job.future.set_exception(InferencePreempted())
+        else:
+            if run.exception() is not None:
+                job.future.set_exception(run.exception())
+            else:
+                job.future.set_result(run.result())
+        self._dispatch()
@@ -8,69 +8,230 @@ Este módulo é o cérebro de IA da Aimi. Ele é responsável por:
 2. Gerenciar o histórico de conversas para manter o contexto.
 3. Construir um prompt dinâmico que define a personalidade, emoção e contexto da Aimi.
 4. Gerar uma resposta de texto coesa e em personagem.
+5. Resumir em segundo plano as falas antigas que saem do histórico.
 """
 
+import asyncio
+import codecs
+import hashlib
 import logging
+import os
+import re
+import threading
+import time
 from ctransformers import AutoModelForCausalLM
 
 # --- Importações Locais ---
 import config
+from ai_core.inference import InferenceExecutor, InferenceQueueFull, InferenceTimeout, InferencePreempted
+from ai_core.response_cache import ResponseCache
+from ai_core.session_store import SessionStore
 from utils import redis as cache
 
 # --- Configuração do Logging ---
 logger = logging.getLogger(__name__)
 
-# --- Variável Global para o Modelo ---
-# O modelo será carregado na memória apenas uma vez (lazy loading).
-llm_model = None
+# --- Executor Global de Inferência ---
+# O pool de workers (e os modelos dentro dele) é criado apenas uma vez (lazy loading).
+inference_executor = None
+# Só vira True depois que todos os workers carregaram e aqueceram o modelo.
+_ready = False
+
+# --- Store Global de Sessões ---
+# Guarda os tokens já avaliados da última resposta de cada usuário (ver `session_store.py`).
+session_store = None
+SESSION_CACHE_DIR = os.path.join(os.path.dirname(__file__), '..', 'cache', 'sessions')
+
+# --- Cache de Respostas (Opcional) ---
+# Respostas prontas para mensagens curtas e frequentes ("oi", "bom dia"...). Ver `response_cache.py`.
+response_cache = None
 
 # --- Constantes de Histórico ---
-HISTORY_MAX_TURNS = 4  # Manter as últimas 4 trocas (usuário + Aimi)
+# O tamanho do histórico é decidido pelo orçamento de tokens do contexto
+# (n_ctx - max_tokens - prefixo - nova fala), não por um número fixo de trocas.
+HISTORY_LOW_WATERMARK = 0.6 # Ao estourar o orçamento, corta até sobrar 60% dele
+HISTORY_MAX_ITEMS = 200 # Limite de segurança no tamanho da lista no Redis
 HISTORY_CACHE_TTL = 60 * 60 * 1 # Cache de 1 hora para o histórico
 
-def _load_llm_model():
+# --- Resumo de Longo Prazo ---
+# As falas que saem da janela do histórico são resumidas em segundo plano
+# (só com a fila de inferência ociosa) e o resumo entra no prompt.
+SUMMARY_RETRY_DELAY = 30 # Espera (em segundos) após o resumo ser interrompido por um pedido ao vivo
+_pending_summaries = {} # user_id -> falas aguardando resumo
+_summary_tasks = {} # user_id -> tarefa de resumo em andamento
+
+# --- Geração ---
+STOP_SEQUENCES = ["Usuário:", "\n"] # A geração para ao encontrar essas palavras
+
+# --- Cache de Prefixo do Prompt ---
+# O bloco [INST] (persona + personalidade + emoção) é idêntico para todos os usuários
+# com a mesma combinação. Guardamos o texto e os tokens de cada combinação e mandamos
+# o pedido ao worker que já avaliou esse prefixo: o ctransformers compara os tokens
+# com o contexto anterior do modelo e só avalia o que mudou (histórico + nova mensagem).
+_prompt_prefixes = {}
+_prefix_tokens = {}
+
+# --- Respostas de Fallback ---
+BUSY_RESPONSE = "Ai, senpai... tem muita gente falando comigo agora! 😵‍💫 Me dá um minutinho e tenta de novo, tá?"
+TIMEOUT_RESPONSE = "Desculpa, senpai... demorei demais pra pensar e me perdi. 😣 Pode mandar de novo?"
+ERROR_RESPONSE = "A-ah... desculpe, senpai. Minha cabeça está um pouco confusa agora... 😳 Tente de novo, por favor."
+
+def _threads_per_worker() -> int:
+    """Calcula quantas threads de CPU cada instância do modelo deve usar."""
+    configured = config.INFERENCE_CONFIG.get('threads_per_worker', 0)
+    if configured:
+        return configured
+    workers = max(1, config.INFERENCE_CONFIG['workers'])
+    return max(1, (os.cpu_count() or 1) // workers)
+
+def _load_llm_model(model_path: str | None = None):
     """
-    Carrega o modelo de linguagem na memória se ainda não foi carregado.
-    Usa as configurações do arquivo `config.py`.
+    Carrega uma nova instância do modelo de linguagem.
+    É chamada uma vez por worker, dentro da thread do próprio worker.
+    Usa as configurações do arquivo `config.py`; `model_path` carrega o modelo
+    próprio de um tier no lugar do modelo padrão.
     """
-    global llm_model
-    if llm_model is None:
-        try:
-            logger.info(f"[LLM] Carregando modelo do caminho: {config.LLM_CONFIG['model_path']}...")
-            # `ctransformers` é ideal para rodar modelos GGUF em CPU.
-            llm_model = AutoModelForCausalLM.from_pretrained(
-                config.LLM_CONFIG['model_path'],
-                model_type='llama', # Tipo do modelo, ajuste se usar outro (ex: 'phi2')
-                context_length=config.LLM_CONFIG['n_ctx'],
-                gpu_layers=config.LLM_CONFIG['n_gpu_layers'],
-                reset=True
-            )
-            logger.info("[LLM] Modelo carregado com sucesso!")
-        except Exception as e:
-            logger.critical(f"[LLM Load Error] Falha crítica ao carregar o modelo de IA: {e}", exc_info=True)
-            # Se o modelo não carregar, o bot não pode funcionar. Poderíamos parar o bot aqui.
-            raise e
+    try:
+        path = model_path or config.LLM_CONFIG['model_path']
+        logger.info(f"[LLM] Carregando modelo do caminho: {path}...")
+        # `ctransformers` é ideal para rodar modelos GGUF em CPU.
+        model = AutoModelForCausalLM.from_pretrained(
+            path,
+            model_type='llama', # Tipo do modelo, ajuste se usar outro (ex: 'phi2')
+            context_length=config.LLM_CONFIG['n_ctx'],
+            gpu_layers=config.LLM_CONFIG['n_gpu_layers'],
+            threads=_threads_per_worker(),
+            batch_size=config.LLM_CONFIG.get('batch_size', 512),
+            reset=True
+        )
+        logger.info("[LLM] Modelo carregado com sucesso!")
+        return model
+    except Exception as e:
+        logger.critical(f"[LLM Load Error] Falha crítica ao carregar o modelo de IA: {e}", exc_info=True)
+        # Se o modelo não carregar, o bot não pode funcionar. Poderíamos parar o bot aqui.
+        raise e
 
-async def _get_conversation_history(user_id: int) -> str:
-    """Recupera o histórico de conversa de um usuário do Redis."""
+def _get_executor() -> InferenceExecutor:
+    """Inicializa o pool de workers de inferência se ainda não existir."""
+    global inference_executor
+    if inference_executor is None:
+        # Tiers com `model_path` próprio ganham workers dedicados a esse modelo.
+        tiers = {
+            name: {"weight": options.get('weight', 1), "model": options.get('model_path')}
+            for name, options in config.INFERENCE_CONFIG.get('tiers', {}).items()
+        }
+        model_paths = {options["model"] for options in tiers.values() if options["model"]}
+        inference_executor = InferenceExecutor(
+            model_factory=_load_llm_model,
+            workers=config.INFERENCE_CONFIG['workers'],
+            max_queue=config.INFERENCE_CONFIG['max_queue'],
+            request_timeout=config.INFERENCE_CONFIG['request_timeout'],
+            tiers=tiers or None,
+            default_tier=config.INFERENCE_CONFIG.get('default_tier', 'default'),
+            model_workers={path: config.INFERENCE_CONFIG.get('tier_model_workers', 1) for path in model_paths}
+        )
+        logger.info(f"[LLM] Executor de inferência criado com {config.INFERENCE_CONFIG['workers']} worker(s) e tiers {list(tiers)}.")
+    return inference_executor
+
+def _parse_history_item(item: str) -> tuple:
+    """
+    Separa um item do histórico no Redis em `(texto, n_tokens)`.
+    Os itens são gravados como "n_tokens|texto"; itens antigos sem contagem
+    retornam `n_tokens = None` e são tokenizados na hora.
+    """
+    count, sep, text = item.partition("|")
+    if sep and count.isdigit():
+        return text, int(count)
+    return item, None
+
+async def _get_conversation_history(user_id: int) -> list:
+    """Recupera o histórico de conversa de um usuário do Redis como `[(texto, n_tokens), ...]`."""
     cache_key = f"aimi:history:{user_id}"
     history_items = await cache.lrange(cache_key, 0, -1)
-    return "\n".join(history_items)
+    return [_parse_history_item(item) for item in history_items]
+
+async def _add_to_conversation_history(user_id: int, history: list, user_text: str, aimi_response: str, turn_info: dict,
+                                       session=None):
+    """
+    Adiciona uma nova troca ao histórico, junto com a contagem de tokens de cada fala.
 
-async def _add_to_conversation_history(user_id: int, user_text: str, aimi_response: str):
-    """Adiciona uma nova troca ao histórico e o mantém no tamanho máximo."""
+    Quando o histórico passa do orçamento de tokens, as falas mais antigas são
+    removidas em bloco até sobrar `HISTORY_LOW_WATERMARK` do orçamento. Cortar em
+    blocos (e não uma fala por vez) mantém o início do histórico estável por
+    várias mensagens, o que preserva a sessão do usuário no worker.
+
+    Com uma `session` (`utils/session.py`), a gravação só é agendada e acontece
+    no `session.save`, junto com as demais alterações da mensagem.
+    """
     cache_key = f"aimi:history:{user_id}"
-    # Adiciona a fala do usuário e da Aimi como itens separados na lista
-    await cache.rpush(cache_key, f"Usuário: {user_text}")
-    await cache.rpush(cache_key, f"Aimi: {aimi_response}")
-    # Se o histórico ficar muito grande, remove os itens mais antigos
-    await cache.ltrim(cache_key, -HISTORY_MAX_TURNS * 2, -1)
-    # Define o tempo de expiração do histórico
-    await cache.expire(cache_key, HISTORY_CACHE_TTL)
 
-def _build_prompt(user_text: str, history: str, personality: dict, emotion: str) -> str:
+    # Se o histórico passar do orçamento de tokens, remove os itens mais antigos
+    counts = [count or 0 for _, count in history] + [turn_info['user_tokens'], turn_info['aimi_tokens']]
+    budget = turn_info['history_budget']
+    total = sum(counts)
+    drop = 0
+    if total > budget:
+        while drop < len(counts) - 2 and total > budget * HISTORY_LOW_WATERMARK:
+            total -= counts[drop]
+            drop += 1
+        logger.debug(f"[LLM History] Histórico de {user_id} cortado em {drop} item(ns) ({total}/{budget} tokens).")
+
+    # As falas removidas não se perdem: vão para o resumo de longo prazo.
+    def on_saved():
+        if drop and config.SUMMARY_CONFIG.get('enabled'):
+            _schedule_summary(user_id, [text for text, _ in history[:drop]])
+
+    # Fala do usuário e da Aimi como itens separados, corte, limite de segurança no
+    # tamanho da lista e expiração: tudo em uma única transação no Redis.
+    values = [f"{turn_info['user_tokens']}|Usuário: {user_text}", f"{turn_info['aimi_tokens']}|Aimi: {aimi_response}"]
+    if session is not None:
+        session.append_history(values, trim_head=drop, max_items=HISTORY_MAX_ITEMS, ttl_seconds=HISTORY_CACHE_TTL, on_saved=on_saved)
+    elif await cache.append_to_list(cache_key, values, trim_head=drop, max_items=HISTORY_MAX_ITEMS, ttl_seconds=HISTORY_CACHE_TTL):
+        on_saved()
+
+def _select_history(model, history: list, budget: int) -> str:
+    """
+    Seleciona as falas mais recentes do histórico que cabem no orçamento de tokens.
+    Usa as contagens salvas no Redis; só tokeniza itens antigos sem contagem.
+    """
+    selected = []
+    used = 0
+    for text, count in reversed(history):
+        if count is None:
+            count = len(model.tokenize(text, add_bos_token=False))
+        if used + count > budget:
+            break
+        selected.append(text)
+        used += count
+    return "\n".join(reversed(selected))
+
+def _get_session_store() -> SessionStore | None:
+    """Inicializa o store de sessões se estiver ativado e ainda não existir."""
+    global session_store
+    if session_store is None and config.SESSION_CACHE_CONFIG.get('enabled'):
+        session_store = SessionStore(
+            disk_dir=SESSION_CACHE_DIR,
+            ttl_seconds=HISTORY_CACHE_TTL, # A sessão não vale mais do que o histórico que ela representa
+            max_memory_bytes=config.SESSION_CACHE_CONFIG['max_memory_mb'] * 1024 * 1024,
+            max_disk_bytes=config.SESSION_CACHE_CONFIG['max_disk_mb'] * 1024 * 1024
+        )
+    return session_store
+
+def _get_response_cache() -> ResponseCache | None:
+    """Inicializa o cache de respostas se estiver ativado e ainda não existir."""
+    global response_cache
+    if response_cache is None and config.RESPONSE_CACHE_CONFIG.get('enabled'):
+        response_cache = ResponseCache(
+            max_keys=config.RESPONSE_CACHE_CONFIG['max_keys'],
+            ttl_seconds=config.RESPONSE_CACHE_CONFIG['ttl_seconds'],
+            pool_size=config.RESPONSE_CACHE_CONFIG['pool_size'],
+            max_message_chars=config.RESPONSE_CACHE_CONFIG['max_message_chars']
+        )
+    return response_cache
+
+def _build_prompt_prefix(personality: dict, emotion: str) -> str:
     """
-    Constrói o prompt final que será enviado para o modelo de IA.
+    Constrói o bloco de instrução ([INST]) do prompt: persona, personalidade e emoção.
     Esta é a parte mais importante para definir o comportamento da Aimi.
     """
     # 1. Instrução do Sistema (Persona Base)
@@ -94,50 +255,404 @@ def _build_prompt(user_text: str, history: str, personality: dict, emotion: str)
     # 3. Estado Emocional Atual
     emotion_prompt = f"No momento, você está se sentindo muito {config.EMOTIONS[emotion]['icon']} {emotion}. {config.EMOTIONS[emotion]['prompt_suffix']}"
 
-    # 4. Montagem Final
-    full_prompt = f"<s>[INST] {system_prompt}\n{emotion_prompt} [/INST]\n\n"
-    full_prompt += f"{history}\n"
-    full_prompt += f"Usuário: {user_text}\n"
-    full_prompt += "Aimi:"
-    
-    logger.debug(f"[LLM Prompt] Prompt construído:\n{full_prompt}")
-    return full_prompt
+    return f"<s>[INST] {system_prompt}\n{emotion_prompt} [/INST]\n\n"
 
-async def generate_response(user_id: int, user_text: str, emotion: str) -> str | None:
+def _build_prompt_suffix(user_text: str, history: str, summary: str = "") -> str:
+    """Constrói a parte variável do prompt: o resumo, o histórico e a nova fala do usuário."""
+    suffix = ""
+    if summary:
+        suffix += f"(Lembranças de conversas anteriores: {summary})\n"
+    suffix += f"{history}\n"
+    suffix += f"Usuário: {user_text}\n"
+    suffix += "Aimi:"
+    return suffix
+
+def _get_prompt_prefix(personality: dict, emotion: str) -> tuple:
     """
-    Gera uma resposta de IA completa, orquestrando todas as etapas.
+    Retorna `(chave, texto)` do prefixo para a combinação (personalidade, emoção),
+    construindo-o apenas na primeira vez.
+    """
+    key = (tuple(sorted(personality.items())), emotion)
+    if key not in _prompt_prefixes:
+        _prompt_prefixes[key] = _build_prompt_prefix(personality, emotion)
+    return key, _prompt_prefixes[key]
+
+def _get_prefix_tokens(model, key: tuple, prefix: str) -> list:
+    """Tokeniza o prefixo uma única vez por modelo (as instâncias de um mesmo modelo compartilham o vocabulário)."""
+    cache_key = (model.model_path, key)
+    tokens = _prefix_tokens.get(cache_key)
+    if tokens is None:
+        tokens = model.tokenize(prefix)
+        _prefix_tokens[cache_key] = tokens
+    return tokens
+
+def _stream_tokens(model, tokens: list, cancel_event, stop: list = STOP_SEQUENCES, max_tokens: int | None = None,
+                   generated: list | None = None):
+    """
+    Gera texto a partir de uma lista de tokens já pronta, pedaço por pedaço.
+
+    Segue o mesmo laço do `model(prompt, stream=True)` do ctransformers
+    (UTF-8 incremental e sequências de parada), mas recebe tokens em vez de texto,
+    o que permite reaproveitar os tokens do prefixo já calculados.
+    Se `generated` for informado, recebe os ids dos tokens da resposta (sem os da sequência de parada).
     """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    stop_regex = re.compile("|".join(map(re.escape, stop)))
+    max_tokens = max_tokens or config.LLM_CONFIG['max_tokens']
+    text = ""
+    count = 0
+    # Tamanho total do texto decodificado ao fim de cada token guardado em `generated`.
+    token_ends = []
+    total = 0
+    started = time.monotonic()
+
     try:
-        _load_llm_model() # Garante que o modelo esteja carregado
-        if not llm_model:
-            raise RuntimeError("Modelo de IA não está disponível.")
+        for count, token in enumerate(_generate_token_ids(model, tokens), start=1):
+            if cancel_event.is_set():
+                return
+            piece = decoder.decode(model.detokenize([token], decode=False))
+            text += piece
+            total += len(piece)
+            if generated is not None:
+                generated.append(token)
+                token_ends.append(total)
+
+            # Se uma sequência de parada apareceu, corta o texto nela e encerra.
+            match = stop_regex.search(text)
+            if match:
+                if generated is not None:
+                    # Descarta os tokens que formaram a sequência de parada.
+                    stop_at = total - len(text) + match.start()
+                    while token_ends and token_ends[-1] > stop_at:
+                        token_ends.pop()
+                        generated.pop()
+                text = text[:match.start()]
+                break
+
+            # Segura o final do texto que pode ser o começo de uma sequência de parada.
+            held = 0
+            for sequence in stop:
+                for i in range(len(sequence), 0, -1):
+                    if text.endswith(sequence[:i]):
+                        held = max(held, i)
+                        break
+            if len(text) > held:
+                yield text[:len(text) - held]
+                text = text[len(text) - held:]
+
+            if count >= max_tokens:
+                break
+
+        if text:
+            yield text
+    finally:
+        _log_generation_stats(count, time.monotonic() - started)
+
+def _generate_token_ids(model, tokens: list):
+    """
+    Gera os ids dos tokens da resposta, reaproveitando o prefixo em comum com o
+    contexto anterior do modelo.
+    """
+    sampling = dict(
+        temperature=config.LLM_CONFIG['temperature'],
+        top_k=config.LLM_CONFIG.get('top_k', 40),
+        top_p=config.LLM_CONFIG['top_p'],
+        repetition_penalty=1.15
+    )
+    yield from model.generate(tokens, reset=True, **sampling)
+
+def _log_generation_stats(token_count: int, elapsed: float):
+    """Registra a velocidade de geração."""
+    if not token_count or elapsed <= 0:
+        return
+    logger.info(f"[LLM Stats] {token_count} tokens em {elapsed:.2f}s ({token_count / elapsed:.1f} tokens/s)")
+
+def _context_digest(model, prefix_key: tuple, summary: str, history: str) -> str:
+    """Assinatura do contexto (modelo + prefixo + resumo + histórico) que uma sessão representa."""
+    return hashlib.md5(f"{model.model_path}|{prefix_key!r}|{summary}|{history}".encode()).hexdigest()
+
+def _run_generation(model, cancel_event, user_id: int, user_text: str, history: list, summary: str,
+                    prefix_key: tuple, prefix: str, sessions: SessionStore | None, on_chunk=None) -> dict:
+    """
+    Executada na thread do worker: gera a resposta token a token,
+    parando cedo se o pedido for cancelado ou expirar.
+    Se `on_chunk` for informado, cada pedaço de texto é repassado assim que gerado.
 
-        history = await _get_conversation_history(user_id)
+    Retorna o texto gerado e as contagens de tokens usadas para gravar o histórico.
+    """
+    prefix_tokens = _get_prefix_tokens(model, prefix_key, prefix)
+    turn = _build_prompt_suffix(user_text, "").lstrip("\n")
+    turn_tokens = model.tokenize(turn, add_bos_token=False)
+    summary_size = len(model.tokenize(summary, add_bos_token=False)) + 8 if summary else 0
+
+    # O histórico ocupa o que sobra do contexto depois do prefixo, do resumo, da nova fala e da resposta.
+    history_budget = config.LLM_CONFIG['n_ctx'] - config.LLM_CONFIG['max_tokens'] - len(prefix_tokens) - summary_size - len(turn_tokens)
+    history_text = _select_history(model, history, max(0, history_budget))
+    suffix = _build_prompt_suffix(user_text, history_text, summary)
+    logger.debug(f"[LLM Prompt] Prompt construído:\n{prefix}{suffix}")
+
+    # Se a sessão do usuário ainda corresponde ao histórico atual, só os tokens
+    # da nova mensagem precisam ser acrescentados. Senão, monta tudo do zero.
+    session_tokens = sessions.get(user_id, _context_digest(model, prefix_key, summary, history_text)) if sessions else None
+    if session_tokens is not None and len(session_tokens) + len(turn_tokens) <= config.LLM_CONFIG['n_ctx'] - config.LLM_CONFIG['max_tokens']:
+        tokens = list(session_tokens) + turn_tokens
+        logger.debug(f"[LLM Session] Sessão restaurada para {user_id} ({len(session_tokens)} tokens).")
+    else:
+        tokens = prefix_tokens + model.tokenize(suffix, add_bos_token=False)
+
+    chunks = []
+    generated = []
+    for chunk in _stream_tokens(model, tokens, cancel_event, generated=generated):
+        chunks.append(chunk)
+        if on_chunk:
+            on_chunk(chunk)
+    response = "".join(chunks)
+    cleaned = response.strip()
+
+    # Salva a sessão como ela ficará depois que a troca for gravada no histórico:
+    # os tokens que o modelo de fato avaliou (prompt + resposta gerada) e a quebra de linha.
+    if sessions and not cancel_event.is_set():
+        new_history = "\n".join(item for item in (history_text, f"Usuário: {user_text}", f"Aimi: {cleaned}") if item)
+        session_tokens = tokens + generated + model.tokenize("\n", add_bos_token=False)
+        sessions.put(user_id, session_tokens, _context_digest(model, prefix_key, summary, new_history))
+
+    return {
+        "text": response,
+        "user_tokens": len(model.tokenize(f"Usuário: {user_text}", add_bos_token=False)) + 1, # +1 pela quebra de linha
+        "aimi_tokens": len(model.tokenize(f"Aimi: {cleaned}", add_bos_token=False)) + 1,
+        "history_budget": history_budget
+    }
+
+async def _get_summary(user_id: int) -> str:
+    """Recupera o resumo de longo prazo da conversa de um usuário."""
+    return await cache.get(f"aimi:summary:{user_id}") or ""
+
+def _run_summary(model, cancel_event, previous_summary: str, turns: list) -> str:
+    """Executada na thread do worker: funde o resumo anterior com as falas antigas."""
+    prompt = (
+        "[INST] Resuma em no máximo três frases curtas os fatos importantes desta conversa "
+        "entre a Aimi e o usuário (nomes, gostos, acontecimentos, promessas). "
+        f"Resumo anterior: {previous_summary or 'nenhum'}\n"
+        "Falas novas:\n" + "\n".join(turns) + " [/INST]\nResumo:"
+    )
+    tokens = model.tokenize(prompt)
+    chunks = _stream_tokens(model, tokens, cancel_event, stop=["\n"], max_tokens=config.SUMMARY_CONFIG['max_tokens'])
+    return "".join(chunks).strip()
+
+def _schedule_summary(user_id: int, turns: list):
+    """Enfileira falas removidas do histórico para entrarem no resumo do usuário."""
+    if not turns:
+        return
+    _pending_summaries.setdefault(user_id, []).extend(turns)
+    if user_id not in _summary_tasks:
+        task = asyncio.create_task(_summarize_pending(user_id))
+        _summary_tasks[user_id] = task
+        task.add_done_callback(lambda _: _summary_tasks.pop(user_id, None))
+
+async def _summarize_pending(user_id: int):
+    """
+    Atualiza o resumo de um usuário como tarefa de segundo plano do executor.
+    Se um pedido ao vivo interromper o resumo, tenta de novo mais tarde.
+    """
+    cache_key = f"aimi:summary:{user_id}"
+    while _pending_summaries.get(user_id):
+        turns = list(_pending_summaries[user_id])
+        previous_summary = await _get_summary(user_id)
+        try:
+            summary = await _get_executor().submit_background(
+                lambda model, cancel_event: _run_summary(model, cancel_event, previous_summary, turns)
+            )
+        except InferencePreempted:
+            await asyncio.sleep(SUMMARY_RETRY_DELAY)
+            continue
+        except Exception as e:
+            logger.error(f"[LLM Summary Error] Falha ao resumir o histórico de {user_id}: {e}", exc_info=True)
+            _pending_summaries.pop(user_id, None)
+            return
+
+        del _pending_summaries[user_id][:len(turns)]
+        if summary:
+            await cache.setex(cache_key, config.SUMMARY_CONFIG['ttl_hours'] * 60 * 60, summary)
+            logger.info(f"[LLM Summary] Resumo de {user_id} atualizado: '{summary}'")
+    _pending_summaries.pop(user_id, None)
+
+async def generate_response_stream(user_id: int, user_text: str, emotion: str, on_queued=None, plan: str | None = None,
+                                   session=None):
+    """
+    Gera a resposta de IA como um gerador assíncrono de pedaços de texto.
+
+    Os pedaços chegam à medida que o modelo os produz. A limpeza final e a
+    gravação no histórico só acontecem quando a geração termina por completo.
+    Em caso de erro antes do primeiro pedaço, gera a mensagem de fallback.
+
+    Args:
+        on_queued: Corrotina opcional chamada com a posição na fila de inferência
+            quando todos os workers estão ocupados.
+        plan: Plano do usuário; define o tier (prioridade e modelo) na fila de inferência.
+        session: Estado do usuário já carregado (`utils/session.py`). Com ela, o histórico
+            e o resumo não são lidos de novo e a gravação fica para o `session.save`.
+    """
+    loop = asyncio.get_running_loop()
+    chunks = asyncio.Queue()
+    generation = None
+    produced = []
+
+    try:
+        if session is not None:
+            history = [_parse_history_item(item) for item in session.history_items]
+            summary = session.summary
+        else:
+            history = await _get_conversation_history(user_id)
+            summary = await _get_summary(user_id)
         
-        prompt = _build_prompt(user_text, history, config.AIMI_PERSONALITY, emotion)
+        # O prefixo (persona + emoção) é o mesmo para todos com a mesma emoção;
+        # só o sufixo (histórico + nova mensagem) muda a cada pedido.
+        prefix_key, prefix = _get_prompt_prefix(config.AIMI_PERSONALITY, emotion)
+
+        # Mensagens curtas e frequentes podem ser respondidas direto do cache, sem inferência.
+        responses = _get_response_cache()
+        response_key = responses.make_key(user_text, emotion, prefix_key[0]) if responses else None
+        cached = responses.get(response_key) if response_key else None
+        if cached:
+            cached_text, cached_turn_info = cached
+            logger.info(f"[LLM Response] Resposta do cache para o usuário {user_id}: '{cached_text}'")
+            produced.append(cached_text)
+            yield cached_text
+            await _add_to_conversation_history(user_id, history, user_text, cached_text, cached_turn_info, session)
+            return
 
         logger.info(f"[LLM] Gerando resposta para o usuário {user_id}...")
-        
-        # Gera a resposta usando o modelo
-        raw_response = llm_model(
-            prompt,
-            max_new_tokens=config.LLM_CONFIG['max_tokens'],
-            temperature=config.LLM_CONFIG['temperature'],
-            top_p=config.LLM_CONFIG['top_p'],
-            stop=["Usuário:", "\n"], # Para a geração ao encontrar essas palavras
-            repetition_penalty=1.15
-        )
+
+        # A geração roda em um worker do pool; os pedaços voltam ao event loop pela fila.
+        def on_chunk(chunk: str):
+            loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+
+        sessions = _get_session_store()
+        generation = asyncio.create_task(_get_executor().submit(
+            lambda model, cancel_event: _run_generation(
+                model, cancel_event, user_id, user_text, history, summary, prefix_key, prefix, sessions, on_chunk
+            ),
+            on_queued=on_queued,
+            # Prefere o worker com a sessão do usuário; depois, um com o mesmo prefixo.
+            affinity=[("user", user_id), prefix_key],
+            tier=plan
+        ))
+
+        while True:
+            next_chunk = asyncio.create_task(chunks.get())
+            await asyncio.wait({next_chunk, generation}, return_when=asyncio.FIRST_COMPLETED)
+            if not next_chunk.done():
+                next_chunk.cancel()
+                break
+            produced.append(next_chunk.result())
+            yield produced[-1]
+
+        # Entrega o que chegou entre o último pedaço e o fim da geração.
+        while not chunks.empty():
+            produced.append(chunks.get_nowait())
+            yield produced[-1]
+        turn_info = generation.result() # Propaga erros da geração (fila cheia, prazo, etc.)
 
         # Limpa a resposta de possíveis artefatos
-        cleaned_response = raw_response.strip()
+        cleaned_response = "".join(produced).strip()
         logger.info(f"[LLM Response] Resposta gerada: '{cleaned_response}'")
+        # Só entram no cache respostas geradas sem histórico nem resumo: as outras podem
+        # citar fatos da conversa deste usuário (nomes etc.) e seriam servidas a outros.
+        if response_key and cleaned_response and not history and not summary:
+            responses.add(response_key, (cleaned_response, turn_info))
 
         # Adiciona a nova interação ao histórico
-        await _add_to_conversation_history(user_id, user_text, cleaned_response)
-
-        return cleaned_response
+        await _add_to_conversation_history(user_id, history, user_text, cleaned_response, turn_info, session)
 
+    except InferenceQueueFull:
+        logger.warning(f"[LLM] Pedido do usuário {user_id} recusado: fila de inferência cheia.")
+        if not produced:
+            yield BUSY_RESPONSE
+    except InferenceTimeout:
+        logger.error(f"[LLM] Pedido do usuário {user_id} excedeu o prazo de inferência.")
+        if not produced:
+            yield TIMEOUT_RESPONSE
     except Exception as e:
         logger.critical(f"[LLM Generate Error] Erro ao gerar resposta de IA: {e}", exc_info=True)
-        return "A-ah... desculpe, senpai. Minha cabeça está um pouco confusa agora... 😳 Tente de novo, por favor."
+        if not produced:
+            yield ERROR_RESPONSE
+    finally:
+        # Se quem consome o gerador desistir no meio, libera o worker.
+        if generation and not generation.done():
+            generation.cancel()
+
+async def generate_response(user_id: int, user_text: str, emotion: str, on_queued=None, plan: str | None = None,
+                            session=None) -> str | None:
+    """
+    Gera uma resposta de IA completa, orquestrando todas as etapas.
+    É a versão sem streaming de `generate_response_stream`.
+    """
+    chunks = []
+    async for chunk in generate_response_stream(user_id, user_text, emotion, on_queued=on_queued, plan=plan, session=session):
+        chunks.append(chunk)
+    return "".join(chunks).strip()
+
+# --- Inicialização (Carga Antecipada e Aquecimento) ---
+
+def _page_in_weights(model_path: str):
+    """
+    Lê o arquivo do modelo uma vez para trazê-lo ao cache de páginas do sistema.
+    Assim, os pesos mapeados com mmap não geram leituras de disco na primeira resposta.
+    """
+    chunk_size = 16 * 1024 * 1024
+    with open(model_path, 'rb', buffering=0) as f:
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+        while f.read(chunk_size):
+            pass
+
+def _warm_up_worker(model, worker_index: int) -> list:
+    """
+    Executada na thread de cada worker logo após a carga: faz uma geração curta
+    para aquecer o modelo e deixa avaliado o prefixo de uma das emoções.
+    As emoções são distribuídas entre os workers, começando pela padrão.
+    """
+    emotions = [config.EMOTION_DEFAULT] + [e for e in config.EMOTIONS if e != config.EMOTION_DEFAULT]
+    emotion = emotions[worker_index % len(emotions)]
+    prefix_key, prefix = _get_prompt_prefix(config.AIMI_PERSONALITY, emotion)
+    tokens = _get_prefix_tokens(model, prefix_key, prefix) + model.tokenize(_build_prompt_suffix("oi", ""), add_bos_token=False)
+    for _ in _stream_tokens(model, tokens, threading.Event(), max_tokens=4):
+        pass
+    return [prefix_key]
+
+async def start():
+    """
+    Carrega e aquece o modelo em todos os workers antes de o bot aceitar mensagens.
+    Deve ser chamada na inicialização da aplicação; levanta exceção se o modelo não carregar.
+    """
+    global _ready
+    model_paths = {config.LLM_CONFIG['model_path']} | {
+        options['model_path'] for options in config.INFERENCE_CONFIG.get('tiers', {}).values() if options.get('model_path')
+    }
+
+    started = time.monotonic()
+    for model_path in model_paths:
+        await asyncio.to_thread(_page_in_weights, model_path)
+    logger.info(f"[LLM Startup] Pesos do modelo carregados no cache de páginas em {time.monotonic() - started:.2f}s.")
+
+    timings = await _get_executor().start(warmup=_warm_up_worker)
+    for index, (load_time, warmup_time) in enumerate(timings):
+        logger.info(f"[LLM Startup] Worker {index}: carga em {load_time:.2f}s, aquecimento em {warmup_time:.2f}s.")
+
+    _ready = True
+    logger.info(f"[LLM Startup] IA pronta em {time.monotonic() - started:.2f}s.")
+
+def stop():
+    """
+    Encerra os workers de inferência: cancela os pedidos na fila e libera as threads.
+    Deve ser chamada no desligamento da aplicação.
+    """
+    global _ready
+    _ready = False
+    if inference_executor is not None:
+        inference_executor.shutdown()
+        logger.info("[LLM] Workers de inferência encerrados.")
 
+def is_ready() -> bool:
+    """Indica se o modelo já foi carregado e aquecido em todos os workers."""
+    return _ready
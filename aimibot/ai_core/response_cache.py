@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+"""
+Cache de Respostas - AimiBOT
+
+Boa parte das mensagens são aberturas curtas e repetidas ("oi", "tudo bem?",
+"bom dia", emojis). Este módulo guarda, para cada mensagem normalizada (junto
+com a emoção e a personalidade), um pequeno conjunto de respostas variadas já
+geradas pelo LLM e faz rodízio entre elas, para que as respostas não pareçam
+repetidas. Um acerto no cache pula a inferência por completo.
+
+- Enquanto o conjunto de uma chave não está completo, cada pedido gera uma
+  resposta nova (miss) que é adicionada ao conjunto.
+- Com o conjunto completo, as respostas são servidas em rodízio (hit).
+- As chaves expiram por TTL e o número de chaves é limitado por LRU.
+- O conjunto só é alimentado com respostas geradas sem histórico nem resumo
+  (o `llm.py` garante isso), pois elas são servidas a qualquer usuário.
+"""
+
+import logging
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+
+# --- Configuração do Logging ---
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normaliza uma mensagem curta para uso como chave de cache:
+    minúsculas, sem acentos, sem pontuação e sem letras repetidas ("Oiii!!" -> "oi").
+    Emojis são preservados.
+    """
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"[^\w\s]", lambda m: m.group() if ord(m.group()) > 0x2000 else " ", text)
+    text = re.sub(r"(.)\1+", r"\1", text)
+    return " ".join(text.split())
+
+
+class _Entry:
+    """Conjunto de respostas de uma chave, com a posição atual do rodízio."""
+
+    def __init__(self, expires_at: float):
+        self.responses = []
+        self.next_index = 0
+        self.expires_at = expires_at
+
+
+class ResponseCache:
+    """Cache LRU com TTL de respostas para mensagens curtas e frequentes."""
+
+    def __init__(self, max_keys: int, ttl_seconds: int, pool_size: int, max_message_chars: int):
+        self._max_keys = max_keys
+        self._ttl = ttl_seconds
+        self._pool_size = pool_size
+        self._max_message_chars = max_message_chars
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def make_key(self, user_text: str, emotion: str, personality_key) -> tuple | None:
+        """Monta a chave do cache, ou retorna None se a mensagem não for elegível."""
+        if len(user_text) > self._max_message_chars:
+            return None
+        normalized = normalize_text(user_text)
+        if not normalized:
+            return None
+        return (normalized, emotion, personality_key)
+
+    def get(self, key: tuple):
+        """
+        Retorna a próxima resposta do rodízio se o conjunto da chave estiver completo.
+        Caso contrário, conta um miss e retorna None (o chamador deve gerar e chamar `add`).
+        """
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at < time.time():
+            del self._entries[key]
+            entry = None
+
+        if entry is None or len(entry.responses) < self._pool_size:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        response = entry.responses[entry.next_index]
+        entry.next_index = (entry.next_index + 1) % len(entry.responses)
+        self.hits += 1
+        logger.debug(f"[Response Cache] Hit para '{key[0]}' ({self.hits} hits / {self.misses} misses).")
+        return response
+
+    def add(self, key: tuple, response):
+        """Adiciona uma resposta recém-gerada ao conjunto da chave."""
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = _Entry(time.time() + self._ttl)
+            self._entries[key] = entry
+            while len(self._entries) > self._max_keys:
+                self._entries.popitem(last=False)
+        self._entries.move_to_end(key)
+        if len(entry.responses) < self._pool_size:
+            entry.responses.append(response)
+
+    def stats(self) -> dict:
+        """Contadores de uso do cache."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "keys": len(self._entries)
+        }
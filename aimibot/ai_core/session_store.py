@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+
+"""
+Armazenamento de Sessões do LLM - AimiBOT
+
+Guarda, por usuário, a sequência de tokens que o modelo já avaliou na última
+resposta (tokens do prompt + ids gerados pelo modelo, não a resposta
+re-tokenizada). Na próxima mensagem, o motor parte dessa sequência
+e só acrescenta os tokens novos, em vez de tokenizar e avaliar todo o histórico
+de novo.
+
+- As sessões ficam em memória, com despejo LRU (menos usada recentemente).
+- Sessões despejadas da memória vão para um diretório local no disco.
+- Memória e disco têm orçamentos máximos em bytes.
+- Sessões expiram junto com o histórico do Redis (`HISTORY_CACHE_TTL`).
+
+Observação: o `ctransformers` não permite salvar/restaurar o KV cache em si. O
+estado "vivo" fica no worker que atendeu o usuário por último; por isso o motor
+também direciona o pedido a esse worker (afinidade). Em qualquer outro worker,
+a sequência de tokens restaurada ainda evita a re-tokenização do histórico.
+
+Todas as operações são thread-safe: o store é usado dentro das threads dos workers,
+o que também mantém o I/O de disco fora do event loop.
+"""
+
+import logging
+import os
+import struct
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+# --- Configuração do Logging ---
+logger = logging.getLogger(__name__)
+
+# Cabeçalho dos arquivos de sessão: expiração (double) + tamanho do digest (uint16).
+_HEADER = struct.Struct("<dH")
+
+
+class Session:
+    """Estado salvo de uma conversa: tokens avaliados e a assinatura do contexto."""
+
+    def __init__(self, tokens: array, context_digest: str, expires_at: float):
+        self.tokens = tokens
+        # Assinatura (prefixo + histórico) que os tokens representam. Se o histórico
+        # mudar por outro caminho (corte, expiração), a sessão deixa de valer.
+        self.context_digest = context_digest
+        self.expires_at = expires_at
+
+    @property
+    def size_bytes(self) -> int:
+        return len(self.tokens) * self.tokens.itemsize
+
+
+class SessionStore:
+    """Cache LRU de sessões em memória com transbordo para o disco."""
+
+    def __init__(self, disk_dir: str, ttl_seconds: int, max_memory_bytes: int, max_disk_bytes: int):
+        self._disk_dir = disk_dir
+        self._ttl = ttl_seconds
+        self._max_memory_bytes = max_memory_bytes
+        self._max_disk_bytes = max_disk_bytes
+        self._sessions = OrderedDict()
+        self._memory_bytes = 0
+        self._last_purge = time.time()
+        self._lock = threading.Lock()
+        os.makedirs(self._disk_dir, exist_ok=True)
+
+    # --- API Pública ---
+
+    def get(self, user_id: int, context_digest: str) -> array | None:
+        """
+        Retorna os tokens da sessão do usuário, se ela existir, não tiver expirado
+        e corresponder ao contexto atual (`context_digest`).
+        """
+        with self._lock:
+            session = self._sessions.pop(user_id, None)
+            if session is not None:
+                self._memory_bytes -= session.size_bytes
+            else:
+                session = self._read_from_disk(user_id)
+
+            if session is None or session.expires_at < time.time():
+                return None
+            if session.context_digest != context_digest:
+                logger.debug(f"[Session] Sessão de {user_id} desatualizada (o histórico mudou). Descartando.")
+                return None
+
+            # Volta para a memória como a mais recente.
+            self._insert(user_id, session)
+            return session.tokens
+
+    def put(self, user_id: int, tokens, context_digest: str):
+        """Salva (ou substitui) a sessão do usuário."""
+        session = Session(array("i", tokens), context_digest, time.time() + self._ttl)
+        with self._lock:
+            old = self._sessions.pop(user_id, None)
+            if old is not None:
+                self._memory_bytes -= old.size_bytes
+            self._insert(user_id, session)
+        # Limpeza periódica das sessões expiradas, aproveitando a thread do worker.
+        if time.time() - self._last_purge > self._ttl / 4:
+            self.purge_expired()
+
+    def purge_expired(self):
+        """Remove da memória e do disco as sessões que já expiraram."""
+        now = time.time()
+        with self._lock:
+            self._last_purge = now
+            for user_id in [uid for uid, s in self._sessions.items() if s.expires_at < now]:
+                self._memory_bytes -= self._sessions.pop(user_id).size_bytes
+            for path, _, _ in self._disk_entries():
+                try:
+                    with open(path, "rb") as f:
+                        expires_at, _ = _HEADER.unpack(f.read(_HEADER.size))
+                    if expires_at < now:
+                        os.remove(path)
+                except (OSError, struct.error):
+                    continue
+
+    # --- Funções Internas ---
+
+    def _insert(self, user_id: int, session: Session):
+        """Insere como mais recente e despeja as mais antigas para o disco se preciso."""
+        self._sessions[user_id] = session
+        self._memory_bytes += session.size_bytes
+        while self._memory_bytes > self._max_memory_bytes and len(self._sessions) > 1:
+            old_user_id, old_session = self._sessions.popitem(last=False)
+            self._memory_bytes -= old_session.size_bytes
+            self._write_to_disk(old_user_id, old_session)
+
+    def _session_path(self, user_id: int) -> str:
+        return os.path.join(self._disk_dir, f"{user_id}.session")
+
+    def _write_to_disk(self, user_id: int, session: Session):
+        """Transborda uma sessão para o disco, respeitando o orçamento de bytes."""
+        if session.expires_at < time.time():
+            return
+        try:
+            digest = session.context_digest.encode()
+            with open(self._session_path(user_id), "wb") as f:
+                f.write(_HEADER.pack(session.expires_at, len(digest)))
+                f.write(digest)
+                f.write(session.tokens.tobytes())
+            self._enforce_disk_budget()
+        except OSError as e:
+            logger.error(f"[Session] Falha ao salvar a sessão de {user_id} no disco: {e}")
+
+    def _read_from_disk(self, user_id: int) -> Session | None:
+        """Lê (e remove do disco) a sessão de um usuário, se existir."""
+        path = self._session_path(user_id)
+        try:
+            with open(path, "rb") as f:
+                expires_at, digest_size = _HEADER.unpack(f.read(_HEADER.size))
+                digest = f.read(digest_size).decode()
+                tokens = array("i")
+                tokens.frombytes(f.read())
+            os.remove(path)
+            return Session(tokens, digest, expires_at)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, struct.error) as e:
+            logger.warning(f"[Session] Arquivo de sessão inválido para {user_id}: {e}")
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+
+    def _disk_entries(self) -> list:
+        """Lista `(caminho, tamanho, mtime)` dos arquivos de sessão no disco."""
+        entries = []
+        with os.scandir(self._disk_dir) as it:
+            for entry in it:
+                if entry.name.endswith(".session"):
+                    stat = entry.stat()
+                    entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _enforce_disk_budget(self):
+        """Apaga os arquivos de sessão mais antigos até caber no orçamento de disco."""
+        entries = self._disk_entries()
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in sorted(entries, key=lambda e: e[2]):
+            if total <= self._max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                continue
@@ -14,17 +14,30 @@ DB_PORT = "5432"
 DB_NAME = "postgres"
 DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
-# --- CONFIGURAÇÕES DE VOZ (gTTS + FFmpeg) ---
+# --- CONFIGURAÇÕES DE VOZ (gTTS / espeak-ng + FFmpeg) ---
+# "engine" escolhe o motor de TTS por idioma: "gtts" (Google, precisa de rede) ou
+# "espeak" (espeak-ng local, sem rede; "espeak_voice" define a voz, ex: "pt-br").
 VOICE_CONFIG = {
     "default_lang": "pt-br",
+    "default_engine": "gtts",
+    "chunked": True, # Renderiza a voz frase a frase, em paralelo (e já durante a geração do texto)
+    "min_chunk_chars": 20, # Frases menores que isso são juntadas à seguinte
+    "personalized_greeting": True, # Inclui o nome do usuário na voz de boas-vindas (só esse trecho é renderizado na hora)
+    "effects_engine": "auto", # "auto" (PyAV no processo, se instalado) ou "ffmpeg" (sempre por subprocesso)
     "languages": {
-        "pt-br": {"pitch": 1.2, "speed": 0.9, "tld": "com.br"},
+        "pt-br": {"pitch": 1.2, "speed": 0.9, "tld": "com.br", "engine": "gtts", "espeak_voice": "pt-br"},
         "en": {"pitch": 1.5, "speed": 1.1, "tld": "com"},
         "es": {"pitch": 1.1, "speed": 1.0, "tld": "es"},
         "ja": {"pitch": 1.8, "speed": 1.2, "tld": "co.jp"}
     }
 }
 
+# --- CACHE DE ÁUDIO (Vozes já geradas, em disco) ---
+AUDIO_CACHE_CONFIG = {
+    "max_disk_mb": 1024, # Orçamento do cache; os áudios menos usados são apagados primeiro
+    "cleanup_interval_minutes": 60 # Intervalo da limpeza de arquivos órfãos
+}
+
 # --- CONFIGURAÇÕES DE EMOÇÃO ---
 EMOTION_DEFAULT = "carinhosa"
 EMOTIONS = {
@@ -51,8 +64,70 @@ LLM_CONFIG = {
     "n_ctx": 2048,  # Contexto máximo do modelo
     "n_gpu_layers": 0, # 0 para rodar 100% na CPU
     "max_tokens": 150, # Máximo de tokens na resposta
+    "batch_size": 512, # Tokens do prompt avaliados por lote (lotes maiores = avaliação mais rápida)
     "temperature": 0.8,
-    "top_p": 0.95
+    "top_p": 0.95,
+    "stream": True, # Envia a resposta aos poucos, editando a mensagem no Telegram
+    "stream_edit_interval": 1.5 # Intervalo mínimo (em segundos) entre edições da mensagem
+}
+
+# --- CONFIGURAÇÕES DE INFERÊNCIA (Pool de Workers do LLM) ---
+# A geração roda fora do event loop, em workers com sua própria instância do modelo.
+INFERENCE_CONFIG = {
+    "workers": 2, # Quantas gerações podem rodar em paralelo
+    "threads_per_worker": 0, # 0 = divide os núcleos da CPU igualmente entre os workers
+    "max_queue": 16, # Pedidos aguardando na fila além dos que já estão rodando
+    "request_timeout": 90, # Prazo máximo (em segundos) de um pedido, incluindo a fila
+    # Prioridade por plano: cada plano tem sua própria fila, e um peso 4 é atendido 4x mais que um peso 1.
+    # `model_path` (opcional) faz o tier usar um modelo próprio (ex: um menor para o trial).
+    "tiers": {
+        "premium": {"weight": 4},
+        "nsfw_plus": {"weight": 4},
+        "trial": {"weight": 1, "model_path": None}
+    },
+    "default_tier": "trial", # Tier usado para planos que não estão na lista acima
+    "tier_model_workers": 1 # Workers dedicados a cada modelo próprio de tier
+}
+
+# --- AGRUPAMENTO DE MENSAGENS (Rajadas do mesmo usuário) ---
+# Mensagens seguidas viram uma única resposta; uma mensagem nova cancela a geração em andamento.
+CHAT_CONFIG = {
+    "debounce_seconds": 1.2, # Quanto tempo esperar por mais mensagens antes de gerar a resposta
+    "max_burst_messages": 6 # Com tantas mensagens acumuladas, responde sem esperar mais
+}
+
+# --- RESUMO DE LONGO PRAZO (Falas que saem do histórico) ---
+SUMMARY_CONFIG = {
+    "enabled": True,
+    "max_tokens": 96, # Tamanho máximo do resumo
+    "ttl_hours": 24 # O resumo dura mais que o histórico (lembranças de conversas antigas)
+}
+
+# --- CACHE DE RESPOSTAS (Mensagens curtas e frequentes) ---
+# Opcional: responde "oi", "bom dia", emojis etc. com respostas já geradas, em rodízio.
+RESPONSE_CACHE_CONFIG = {
+    "enabled": False,
+    "pool_size": 5, # Respostas diferentes guardadas por mensagem antes de começar o rodízio
+    "max_keys": 2000, # Máximo de mensagens distintas no cache (LRU)
+    "ttl_seconds": 60 * 60 * 6, # Renova as respostas a cada 6 horas
+    "max_message_chars": 24 # Só mensagens curtas são elegíveis
+}
+
+# --- SESSÕES DO LLM (Reaproveitamento do contexto entre mensagens) ---
+SESSION_CACHE_CONFIG = {
+    "enabled": True,
+    "max_memory_mb": 64, # Sessões mais antigas transbordam para o disco
+    "max_disk_mb": 512 # Sessões mais antigas no disco são apagadas
+}
+
+# --- CACHE LOCAL SOBRE O REDIS (L1 em memória) ---
+# Leituras de chaves "quentes" são servidas da memória do processo; qualquer gravação
+# feita pelo bot avisa os outros processos por um canal pub/sub para descartarem a cópia.
+L1_CACHE_CONFIG = {
+    "enabled": False,
+    "max_keys": 10000, # Máximo de chaves em memória (LRU)
+    "ttl_seconds": 30, # Validade máxima de uma cópia local (cobre expirações e gravações externas)
+    "prefixes": ["aimi:emotion:", "aimi:voice_id:", "aimi:access:", "aimi:summary:"] # Chaves elegíveis
 }
 
 
@@ -65,6 +140,31 @@ OPERATION_MODES = {
     "modo_debug": False, # Ativa logs detalhados no console
 }
 
+# --- FRASES FIXAS (Voz Pré-Renderizada) ---
+# Falas fixas da Aimi. A voz de cada uma é renderizada na inicialização (`tts.start`)
+# e fica em memória, então enviá-las não custa nenhuma renderização.
+# "greeting" (opcional) é o trecho personalizado ({first_name}) que vem antes do
+# texto fixo: só ele é renderizado na hora, e é curto.
+VOICE_PHRASES = {
+    "welcome_new": {
+        "greeting": "O-oi, senpai {first_name}!",
+        "text": f"Meu nome é Aimi. Prazer em conhecer você! ❤️ Você tem {OPERATION_MODES['trial_duration_minutes']} minutos para conversar comigo e testar minha voz!",
+        "emotion": EMOTION_DEFAULT
+    },
+    "welcome_back": {
+        "greeting": "Bem-vindo de volta, senpai {first_name}!",
+        "text": "Que bom te ver de novo! 🥰",
+        "emotion": EMOTION_DEFAULT
+    },
+    "start_conversation": {
+        "text": "Ebaaa! 🎉 Estou pronta! Pode me mandar sua primeira mensagem, senpai. O que você quer me contar?",
+        "emotion": "fofa"
+    },
+    "waking_up": {"text": "Hmm... ainda estou acordando, senpai! 😴 Me dá um segundinho e tenta de novo.", "emotion": EMOTION_DEFAULT},
+    "no_response": {"text": "Desculpe, senpai... não consigo pensar em nada agora. 😥", "emotion": "triste"},
+    "error": {"text": "A-ah... aconteceu um erro aqui dentro, senpai. Tente de novo, por favor! 😳", "emotion": "envergonhada"},
+}
+
 # --- PLANOS E PRODUTOS (Stripe) ---
 # IDs dos produtos criados no seu painel Stripe
 STRIPE_PRODUCTS = {
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+"""
+Efeitos de Voz no Processo - AimiBOT
+
+Aplica o pitch (tom) e a speed (velocidade) de `VOICE_CONFIG` e codifica em
+Opus/OGG sem abrir um processo do FFmpeg por resposta. Usa o PyAV (bindings da
+libav, a mesma biblioteca do FFmpeg) com o mesmo grafo de filtros
+(`asetrate` + `atempo`), então a voz sai igual à do caminho com subprocesso.
+
+O PyAV é opcional: sem ele (ou se ele falhar), o `tts.py` continua usando o
+FFmpeg por pipes. As funções daqui são bloqueantes (CPU) e devem ser chamadas
+fora do event loop (ex: `asyncio.to_thread`).
+
+Para comparar os dois caminhos: `python handlers/audio_fx.py [iterações]`
+(executado a partir do diretório `aimibot/`).
+"""
+
+import io
+import logging
+from fractions import Fraction
+
+try:
+    import av
+except ImportError: # PyAV é opcional (ver requirements.txt).
+    av = None
+
+# --- Configuração do Logging ---
+logger = logging.getLogger(__name__)
+
+# O Telegram toca Opus; o libopus trabalha a 48 kHz com quadros de 20 ms.
+OPUS_SAMPLE_RATE = 48000
+OPUS_FRAME_SAMPLES = 960
+OPUS_BITRATE = 48000 # 48kbps, bom para voz
+
+
+class AudioEffectsError(Exception):
+    """O processamento no processo falhou (o chamador deve usar o FFmpeg)."""
+
+
+def available() -> bool:
+    """True se o PyAV estiver instalado."""
+    return av is not None
+
+def ffmpeg_effects_command(sample_rate: int, voice_params: dict) -> list:
+    """Comando do FFmpeg equivalente a `apply_effects` (áudio base pela entrada padrão, Opus pela saída)."""
+    # Usamos o codec 'libopus' que é ótimo para voz no Telegram.
+    return [
+        'ffmpeg',
+        '-loglevel', 'error',
+        '-i', 'pipe:0',
+        '-filter:a',
+        f"asetrate={sample_rate * voice_params['pitch']},atempo={voice_params['speed']}",
+        '-c:a', 'libopus',
+        '-b:a', f"{OPUS_BITRATE // 1000}k",
+        '-f', 'ogg',
+        'pipe:1'
+    ]
+
+def apply_effects(base_audio: bytes, sample_rate: int, voice_params: dict) -> bytes:
+    """
+    Decodifica o áudio base (MP3/WAV), aplica pitch e speed e retorna o Opus/OGG.
+    `sample_rate` é a taxa de referência do motor de TTS, como no comando do FFmpeg.
+    """
+    filters = [
+        ("asetrate", f"{sample_rate * voice_params['pitch']}"),
+        ("atempo", f"{voice_params['speed']}"),
+    ]
+    try:
+        with av.open(io.BytesIO(base_audio)) as source:
+            stream = source.streams.audio[0]
+            return _encode_opus(source.decode(stream), stream, filters)
+    except Exception as e:
+        # Qualquer falha (erro da libav, arquivo sem áudio, API diferente em outra
+        # versão do PyAV...) vira `AudioEffectsError`, para o `tts.py` usar o FFmpeg.
+        raise AudioEffectsError(f"PyAV falhou ao processar o áudio: {e}") from e
+
+def concat(parts: list) -> bytes:
+    """Junta vários áudios Opus/OGG (ex: as frases de uma resposta) em um só."""
+    try:
+        sources = [av.open(io.BytesIO(part)) for part in parts]
+        try:
+            frames = (frame for source in sources for frame in source.decode(source.streams.audio[0]))
+            return _encode_opus(frames, sources[0].streams.audio[0], [])
+        finally:
+            for source in sources:
+                source.close()
+    except Exception as e:
+        raise AudioEffectsError(f"PyAV falhou ao juntar os áudios: {e}") from e
+
+# --- Funções Internas ---
+
+def _encode_opus(frames, template, filters: list) -> bytes:
+    """Passa os quadros pelo grafo de filtros e codifica o resultado em Opus/OGG, em memória."""
+    graph = av.filter.Graph()
+    nodes = [graph.add_abuffer(template=template)]
+    nodes += [graph.add(name, args) for name, args in filters]
+    # Normaliza para o que o libopus aceita e corta em quadros de 20 ms (o último é completado com silêncio).
+    nodes.append(graph.add("aformat", f"sample_fmts=flt:sample_rates={OPUS_SAMPLE_RATE}:channel_layouts=mono"))
+    nodes.append(graph.add("asetnsamples", f"n={OPUS_FRAME_SAMPLES}:p=1"))
+    nodes.append(graph.add("abuffersink"))
+    for upstream, downstream in zip(nodes, nodes[1:]):
+        upstream.link_to(downstream)
+    graph.configure()
+
+    output = io.BytesIO()
+    with av.open(output, mode='w', format='ogg') as container:
+        encoder = container.add_stream('libopus', rate=OPUS_SAMPLE_RATE, layout='mono', bit_rate=OPUS_BITRATE)
+
+        def drain():
+            while True:
+                try:
+                    filtered = graph.pull()
+                except (av.error.BlockingIOError, av.error.EOFError):
+                    return
+                container.mux(encoder.encode(filtered))
+
+        position = 0
+        for frame in frames:
+            # Linha do tempo contínua (no `concat`, cada arquivo começaria do zero).
+            frame.pts = position
+            frame.time_base = Fraction(1, frame.sample_rate)
+            position += frame.samples
+            graph.push(frame)
+            drain()
+        graph.push(None)
+        drain()
+        container.mux(encoder.encode(None))
+    return output.getvalue()
+
+
+# --- Benchmark: PyAV no processo x FFmpeg por subprocesso ---
+
+if __name__ == "__main__":
+    import math
+    import struct
+    import subprocess
+    import sys
+    import time
+    import wave
+
+    logging.basicConfig(level=logging.INFO)
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    # Mesmos parâmetros da voz padrão (pt-br) e um áudio base de ~4 s, do tamanho de uma resposta típica.
+    params = {"pitch": 1.2, "speed": 0.9}
+    rate = 22050
+    samples = b"".join(struct.pack("<h", int(8000 * math.sin(2 * math.pi * 220 * n / rate))) for n in range(rate * 4))
+    wav = io.BytesIO()
+    with wave.open(wav, 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(samples)
+    base = wav.getvalue()
+
+    def measure(label, fn):
+        fn() # Aquecimento (carrega codecs, caches do SO etc.).
+        started = time.perf_counter()
+        for _ in range(iterations):
+            size = len(fn())
+        elapsed = (time.perf_counter() - started) / iterations
+        print(f"{label:<22} {elapsed * 1000:8.1f} ms/áudio  ({size} bytes)")
+
+    print(f"Benchmark de efeitos de voz: {iterations} iteração(ões), áudio base de {len(base)} bytes.")
+    if available():
+        measure("PyAV (no processo)", lambda: apply_effects(base, rate, params))
+    else:
+        print("PyAV não instalado: pulando o caminho no processo.")
+    measure("FFmpeg (subprocesso)", lambda: subprocess.run(
+        ffmpeg_effects_command(rate, params), input=base, capture_output=True, check=True
+    ).stdout)
@@ -10,10 +10,17 @@ Este módulo é o coração da interação de roleplay. Ele orquestra:
 4. A chamada ao módulo de TTS (`tts.py`) para converter o texto em voz.
 5. O envio das respostas (texto e voz) de volta ao usuário.
 6. A atualização do estado emocional da Aimi.
+
+As etapas independentes rodam em paralelo (ver `_reply`) e o tempo de cada uma
+é registrado.
 """
 
 import logging
+import asyncio
+import contextlib
+import time
 from telegram import Update, ChatAction
+from telegram.error import BadRequest, RetryAfter
 from telegram.ext import ContextTypes
 
 # --- Importações Locais ---
@@ -22,25 +29,188 @@ from telegram.ext import ContextTypes
 import config
 from ai_core import llm
 from handlers import tts, emotion
-from utils import pg as db, redis as cache # Usando aliases para clareza
+from utils import pg as db, redis as cache, session as session_state # Usando aliases para clareza
 
 # --- Configuração do Logging ---
 logger = logging.getLogger(__name__)
 
 
+async def _edit_reply(message, text: str, final: bool = False) -> bool:
+    """
+    Edita a mensagem de resposta respeitando os limites de edição do Telegram.
+    Edições intermediárias são descartadas se o Telegram pedir para esperar;
+    a edição final espera o tempo pedido e tenta de novo.
+    """
+    try:
+        await message.edit_text(text)
+        return True
+    except RetryAfter as e:
+        if not final:
+            logger.debug(f"[Chat Stream] Limite de edição atingido, pulando edição ({e.retry_after}s).")
+            return False
+        await asyncio.sleep(e.retry_after)
+        return await _edit_reply(message, text, final=False)
+    except BadRequest as e:
+        # "Message is not modified" não é um erro real para nós.
+        if "not modified" in str(e).lower():
+            return True
+        raise
+
+async def _send_streamed_reply(update: Update, chunks, on_complete=None, on_text=None) -> str:
+    """
+    Envia a resposta da IA à medida que ela é gerada: o primeiro pedaço vira uma
+    mensagem nova e os seguintes atualizam essa mensagem com edições espaçadas.
+    Retorna o texto final completo. Se for cancelada no meio, apaga o texto parcial.
+    `on_complete` (corrotina) é aguardada assim que a geração termina, antes da edição final.
+    `on_text` recebe cada pedaço assim que ele chega (ex: para já ir renderizando a voz).
+    """
+    edit_interval = config.LLM_CONFIG.get('stream_edit_interval', 1.5)
+    sent_message = None
+    full_text = ""
+    shown_text = ""
+    last_edit = 0.0
+
+    try:
+        async for chunk in chunks:
+            full_text += chunk
+            if on_text:
+                on_text(chunk)
+            visible_text = full_text.strip()
+            if not visible_text:
+                continue
+
+            if sent_message is None:
+                # Primeiro pedaço: envia logo para reduzir o tempo até o primeiro texto visível.
+                sent_message = await update.message.reply_text(visible_text)
+                shown_text, last_edit = visible_text, time.monotonic()
+            elif time.monotonic() - last_edit >= edit_interval and visible_text != shown_text:
+                if await _edit_reply(sent_message, visible_text):
+                    shown_text = visible_text
+                last_edit = time.monotonic()
+    except asyncio.CancelledError:
+        # Resposta cancelada por uma mensagem mais nova: apaga o texto parcial.
+        if sent_message is not None:
+            try:
+                await sent_message.delete()
+            except Exception as e:
+                logger.debug(f"[Chat Stream] Não foi possível apagar a resposta parcial: {e}")
+        raise
+
+    if on_complete:
+        await on_complete()
+    final_text = full_text.strip()
+    if sent_message is not None and final_text != shown_text:
+        await _edit_reply(sent_message, final_text, final=True)
+    return final_text
+
+
+class _UserBurst:
+    """Mensagens de um usuário ainda sem resposta e a tarefa que vai respondê-las."""
+
+    def __init__(self):
+        self.texts = []
+        self.update = None
+        # Tarefa que espera a janela de agrupamento e depois gera a resposta.
+        self.task = None
+        # Enquanto True, uma mensagem nova cancela a tarefa (a resposta ainda não saiu por completo).
+        self.cancellable = False
+
+
+# --- Rajadas de Mensagens por Usuário ---
+_bursts = {}
+
+
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     Processa todas as mensagens de texto recebidas que não são comandos.
+
+    As mensagens não são respondidas na hora: elas se acumulam por uma curta janela
+    (`CHAT_CONFIG['debounce_seconds']`) e a rajada inteira vira uma única resposta.
+    Se chegar uma mensagem nova enquanto a resposta anterior ainda está na fila ou
+    sendo gerada, essa geração é cancelada e refeita com todas as mensagens juntas.
     """
     user = update.effective_user
     message_text = update.message.text
 
     logger.info(f"[Chat] Mensagem recebida de {user.first_name} (ID: {user.id}): '{message_text}'")
+    # Atualiza o `last_seen_at` sem tocar no banco agora (gravação em lote no `pg.py`).
+    db.record_activity(user.id)
+
+    if not llm.is_ready():
+        # O modelo ainda está carregando (o `post_init` do main.py deveria impedir isso).
+        await update.message.reply_text(config.VOICE_PHRASES["waking_up"]["text"])
+        await tts.send_phrase(update.message.reply_voice, "waking_up", user_id=user.id)
+        return
+
+    burst = _bursts.setdefault(user.id, _UserBurst())
+    burst.texts.append(message_text)
+    burst.update = update
+
+    if burst.task and not burst.task.done() and burst.cancellable:
+        # A resposta em andamento ficou obsoleta: as mensagens dela continuam em
+        # `burst.texts` e serão respondidas junto com a nova.
+        logger.info(f"[Chat] Nova mensagem de {user.id}: cancelando a resposta anterior ({len(burst.texts)} mensagens agrupadas).")
+        burst.task.cancel()
+
+    burst.task = asyncio.create_task(_answer_burst(user.id, burst, context))
+    burst.cancellable = True
+
+async def _answer_burst(user_id: int, burst: _UserBurst, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Espera a janela de agrupamento e responde a todas as mensagens acumuladas."""
+    if len(burst.texts) < config.CHAT_CONFIG.get('max_burst_messages', 6):
+        await asyncio.sleep(config.CHAT_CONFIG.get('debounce_seconds', 1.2))
+
+    texts = list(burst.texts)
+    committed = False
+    if len(texts) > 1:
+        logger.info(f"[Chat] Respondendo {len(texts)} mensagens seguidas de {user_id} de uma vez.")
+
+    def commit():
+        # A resposta está completa: as mensagens respondidas saem da rajada.
+        nonlocal committed
+        if not committed:
+            committed = True
+            del burst.texts[:len(texts)]
+            burst.cancellable = False
 
     try:
-        # --- ETAPA 1: Verificar permissão do usuário ---
-        # (Esta função será implementada em `utils/pg.py`)
-        has_access, reason = await db.check_user_access(user.id)
+        await _reply(burst.update, context, " ".join(texts), commit)
+        commit()
+    finally:
+        # Se foi cancelada, as mensagens continuam na rajada para a próxima resposta.
+        if burst.task is asyncio.current_task() and not burst.texts:
+            _bursts.pop(user_id, None)
+
+async def _reply(update: Update, context: ContextTypes.DEFAULT_TYPE, message_text: str, commit) -> None:
+    """
+    Gera e envia a resposta (texto e voz) para uma mensagem (ou rajada de mensagens).
+    `commit` é chamada assim que o texto da resposta fica pronto; a partir daí,
+    mensagens novas não cancelam mais esta resposta.
+
+    As etapas formam um grafo, não uma fila: o que não depende de outra etapa não
+    espera por ela.
+
+        carregar sessão ─┐
+                         ├─> gerar texto ─> enviar texto ─┬─> voz
+        verificar acesso ┘                                └─> gravar emoção/histórico (segundo plano)
+
+    As ações de chat ("digitando", "gravando áudio") são enviadas sem esperar a
+    resposta do Telegram. A duração de cada etapa é registrada (`get_stage_stats`).
+    """
+    user = update.effective_user
+    chat_id = update.effective_chat.id
+    timer = _StageTimer()
+    voice_composer = None
+
+    try:
+        # --- ETAPA 1: Carregar o estado do usuário e verificar permissão (em paralelo) ---
+        # Emoção, histórico e resumo vêm do Redis em uma única ida e volta; o acesso vem
+        # do cache de acesso ou, se preciso, do PostgreSQL, ao mesmo tempo.
+        with timer.stage("load"):
+            session, (has_access, reason, plan) = await asyncio.gather(
+                _load_session(user.id),
+                db.check_user_access(user.id)
+            )
         
         if not has_access:
             # Se o usuário não tem acesso (ex: trial expirado), envia uma mensagem de upsell e para.
@@ -49,57 +219,174 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             return
 
         # --- ETAPA 2: Feedback visual para o usuário ---
-        # Informa ao usuário que o bot está "pensando".
-        await context.bot.send_chat_action(chat_id=update.effective_chat.id, action=ChatAction.TYPING)
+        # Informa ao usuário que o bot está "pensando" (sem esperar o Telegram).
+        _send_chat_action(context, chat_id, ChatAction.TYPING)
 
         # --- ETAPA 3: Gerar a resposta da IA ---
-        # (Esta função será implementada em `ai_core/llm.py`)
         # Ela considerará a personalidade da Aimi, o histórico e a emoção atual.
-        current_emotion = await emotion.get_current_emotion(user.id)
-        ai_response_text = await llm.generate_response(
-            user_id=user.id,
-            user_text=message_text,
-            emotion=current_emotion
-        )
+        current_emotion = session.emotion
+
+        async def text_ready():
+            # O texto está completo: mensagens novas não cancelam mais esta resposta, e
+            # a nova emoção e a troca são gravadas em segundo plano (uma única gravação).
+            commit()
+            _persist_session(session, message_text)
+
+        async def notify_queue_position(position: int):
+            # Se todos os workers estiverem ocupados, avisa o usuário da posição na fila.
+            await update.message.reply_text(f"Só um instante, senpai! Você é o {position}º da fila... já já te respondo! 💭")
+
+        with timer.stage("text"):
+            if config.LLM_CONFIG.get('stream'):
+                # Modo streaming: o texto aparece para o usuário enquanto a IA ainda está gerando.
+                if config.VOICE_CONFIG.get('chunked'):
+                    # A voz de cada frase começa a ser renderizada assim que a frase termina.
+                    voice_composer = tts.VoiceComposer(user.id, current_emotion)
+                ai_response_text = await _send_streamed_reply(update, llm.generate_response_stream(
+                    user_id=user.id,
+                    user_text=message_text,
+                    emotion=current_emotion,
+                    on_queued=notify_queue_position,
+                    plan=plan,
+                    session=session
+                ), on_complete=text_ready, on_text=voice_composer.feed if voice_composer else None)
+            else:
+                ai_response_text = await llm.generate_response(
+                    user_id=user.id,
+                    user_text=message_text,
+                    emotion=current_emotion,
+                    on_queued=notify_queue_position,
+                    plan=plan,
+                    session=session
+                )
+                if ai_response_text:
+                    # Envia a resposta em texto imediatamente.
+                    await update.message.reply_text(ai_response_text)
+                await text_ready()
 
         if not ai_response_text:
             logger.error("[LLM Error] A IA não retornou uma resposta.")
-            await update.message.reply_text("Desculpe, senpai... não consigo pensar em nada agora. 😥")
+            await update.message.reply_text(config.VOICE_PHRASES["no_response"]["text"])
+            await tts.send_phrase(update.message.reply_voice, "no_response", user_id=user.id)
             return
 
-        # Envia a resposta em texto imediatamente.
-        await update.message.reply_text(ai_response_text)
-
         # --- ETAPA 4: Gerar e enviar a voz ---
-        # Informa que o bot está "gravando áudio".
-        await context.bot.send_chat_action(chat_id=update.effective_chat.id, action=ChatAction.RECORD_VOICE)
-
-        # (Esta função será implementada em `handlers/tts.py`)
-        # Ela gera o áudio, aplica efeitos e o salva em cache.
-        voice_file = await tts.generate_voice(
-            text=ai_response_text, 
-            user_id=user.id, 
-            emotion=current_emotion
-        )
-
-        if voice_file:
-            with open(voice_file, 'rb') as voice:
-                await update.message.reply_voice(voice=voice)
-            # (Opcional: remover o arquivo de áudio local após o envio se não for mais necessário)
-            # os.remove(voice_file)
-        else:
-            logger.error(f"[TTS Error] Não foi possível gerar o áudio para o texto: '{ai_response_text}'")
+        # Informa que o bot está "gravando áudio" (sem esperar o Telegram).
+        _send_chat_action(context, chat_id, ChatAction.RECORD_VOICE)
+
+        # (Esta função está em `handlers/tts.py`)
+        # Ela gera o áudio (ou reaproveita o file_id de um envio anterior) e o envia.
+        with timer.stage("voice"):
+            voice_sent = await tts.send_voice(
+                update.message.reply_voice,
+                text=ai_response_text, 
+                user_id=user.id, 
+                emotion=current_emotion,
+                render=voice_composer.finish if voice_composer else None
+            )
+        voice_composer = None
 
-        # --- ETAPA 5: Atualizar a emoção da Aimi ---
-        # A emoção da Aimi muda com base na conversa.
-        # (Esta função será implementada em `handlers/emotion.py`)
-        await emotion.update_emotion(
-            user_id=user.id, 
-            user_text=message_text, 
-            aimi_response=ai_response_text
-        )
+        if not voice_sent:
+            logger.error(f"[TTS Error] Não foi possível gerar o áudio para o texto: '{ai_response_text}'")
+        timer.log(user.id)
 
+    except asyncio.CancelledError:
+        logger.debug(f"[Chat] Resposta para {user.id} cancelada por uma mensagem mais nova.")
+        raise
     except Exception as e:
         logger.critical(f"[Chat Handler Error] Erro inesperado ao processar mensagem de {user.id}: {e}", exc_info=True)
-        await update.message.reply_text("A-ah... aconteceu um erro aqui dentro, senpai. Tente de novo, por favor! 😳")
+        await update.message.reply_text(config.VOICE_PHRASES["error"]["text"])
+        await tts.send_phrase(update.message.reply_voice, "error", user_id=user.id)
+    finally:
+        # Frases já em renderização para uma voz que não vai mais ser enviada.
+        if voice_composer:
+            voice_composer.cancel()
+
+
+# --- Etapas em Segundo Plano ---
+# Tarefas disparadas sem esperar (ações de chat, gravações): mantém as referências vivas.
+_background_tasks = set()
+# Última gravação de sessão de cada usuário: a próxima resposta espera por ela antes de ler.
+_pending_saves = {}
+
+def _spawn(coro, description: str) -> asyncio.Task:
+    """Dispara uma tarefa em segundo plano, supervisionada: falhas são registradas, nunca perdidas."""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+
+    def on_done(done: asyncio.Task):
+        _background_tasks.discard(done)
+        if not done.cancelled() and done.exception() is not None:
+            logger.error(f"[Chat] Falha em segundo plano ({description}): {done.exception()}", exc_info=done.exception())
+
+    task.add_done_callback(on_done)
+    return task
+
+def _send_chat_action(context: ContextTypes.DEFAULT_TYPE, chat_id: int, action: str):
+    """Envia uma ação de chat ("digitando" etc.) sem esperar a resposta do Telegram."""
+    _spawn(context.bot.send_chat_action(chat_id=chat_id, action=action), f"ação de chat '{action}'")
+
+async def _load_session(user_id: int) -> session_state.ChatSession:
+    """Carrega a sessão do usuário, esperando antes a gravação da resposta anterior (se ainda estiver em andamento)."""
+    pending = _pending_saves.get(user_id)
+    if pending is not None:
+        # `shield`: se esta resposta for cancelada, a gravação da anterior continua.
+        await asyncio.wait([asyncio.shield(pending)])
+    return await session_state.load(user_id)
+
+def _persist_session(session: session_state.ChatSession, message_text: str):
+    """Atualiza a emoção e grava a sessão (com o histórico) em segundo plano."""
+    async def persist():
+        started = time.monotonic()
+        emotion.update_session_emotion(session, message_text)
+        await session_state.save(session)
+        _record_stage("persist", (time.monotonic() - started) * 1000)
+
+    task = _spawn(persist(), f"gravação da sessão de {session.user_id}")
+    _pending_saves[session.user_id] = task
+
+    def forget(done: asyncio.Task):
+        if _pending_saves.get(session.user_id) is done:
+            del _pending_saves[session.user_id]
+
+    task.add_done_callback(forget)
+
+
+# --- Tempos por Etapa ---
+# Etapa -> {"count", "total_ms", "max_ms"}, acumulado desde o início do processo.
+stage_stats = {}
+
+def _record_stage(name: str, elapsed_ms: float):
+    stats = stage_stats.setdefault(name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+    stats["count"] += 1
+    stats["total_ms"] += elapsed_ms
+    stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+
+def get_stage_stats() -> dict:
+    """Média e máximo (em ms) de cada etapa das respostas."""
+    return {
+        name: {"count": s["count"], "avg_ms": s["total_ms"] / s["count"], "max_ms": s["max_ms"]}
+        for name, s in stage_stats.items()
+    }
+
+
+class _StageTimer:
+    """Mede as etapas de uma resposta e acumula os tempos em `stage_stats`."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.durations = {}
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        started = time.monotonic()
+        yield
+        # (Etapas interrompidas por erro ou cancelamento não entram nas estatísticas.)
+        self.durations[name] = (time.monotonic() - started) * 1000
+        _record_stage(name, self.durations[name])
 
+    def log(self, user_id: int):
+        total = (time.monotonic() - self.started) * 1000
+        _record_stage("total", total)
+        stages = " ".join(f"{name}={elapsed:.0f}ms" for name, elapsed in self.durations.items())
+        logger.info(f"[Chat Timing] Resposta para {user_id}: {stages} total={total:.0f}ms")
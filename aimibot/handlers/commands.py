@@ -9,6 +9,7 @@ como /start, /ajuda, /status, etc. Também processa os cliques em botões
 """
 
 import logging
+from functools import partial
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 
@@ -40,15 +41,13 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     # --- ETAPA 2: Gerar e enviar mensagem de boas-vindas ---
     await update.message.reply_text(welcome_message)
 
-    # Gera a voz para a mensagem de boas-vindas
-    voice_file = await tts.generate_voice(
-        text=welcome_message, 
-        user_id=user.id, 
-        emotion=config.EMOTION_DEFAULT
+    # A voz de boas-vindas é pré-renderizada; só a saudação com o nome é gerada na hora
+    await tts.send_phrase(
+        update.message.reply_voice,
+        "welcome_new" if is_new_user else "welcome_back",
+        user_id=user.id,
+        first_name=user.first_name
     )
-    if voice_file:
-        with open(voice_file, 'rb') as voice:
-            await update.message.reply_voice(voice=voice)
     
     # --- ETAPA 3: Criar e enviar botão de interação ---
     keyboard = [
@@ -108,18 +107,14 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
     # --- Lógica para cada botão ---
     if query.data == "start_conversation":
-        response_text = "Ebaaa! 🎉 Estou pronta! Pode me mandar sua primeira mensagem, senpai. O que você quer me contar?"
-        await query.edit_message_text(text=response_text)
+        await query.edit_message_text(text=config.VOICE_PHRASES["start_conversation"]["text"])
         
-        # Gera uma voz para a resposta do botão
-        voice_file = await tts.generate_voice(
-            text=response_text, 
-            user_id=query.from_user.id, 
-            emotion="fofa"
+        # Voz pré-renderizada na inicialização (ou o file_id de um envio anterior)
+        await tts.send_phrase(
+            partial(context.bot.send_voice, chat_id=update.effective_chat.id),
+            "start_conversation",
+            user_id=query.from_user.id
         )
-        if voice_file:
-            with open(voice_file, 'rb') as voice:
-                await context.bot.send_voice(chat_id=query.effective_chat.id, voice=voice)
     
     # (Futuramente, outros botões como "ver_planos", "confirmar_compra", etc., serão tratados aqui)
     # elif query.data == "show_plans":
@@ -72,9 +72,10 @@ async def get_current_emotion(user_id: int) -> str:
     logger.debug(f"[Emotion] Nenhuma emoção no cache para {user_id}. Usando padrão.")
     return config.EMOTION_DEFAULT
 
-async def update_emotion(user_id: int, user_text: str, aimi_response: str) -> str:
+def detect_emotion(user_text: str) -> tuple:
     """
-    Analisa o texto do usuário, determina a nova emoção e a salva no cache.
+    Analisa o texto do usuário e retorna `(emoção, pontuação)`.
+    Pontuação 0 significa que nenhum gatilho foi encontrado.
     """
     detected_emotion = config.EMOTION_DEFAULT # Começa com a emoção padrão
     highest_score = 0
@@ -98,6 +99,14 @@ async def update_emotion(user_id: int, user_text: str, aimi_response: str) -> st
             highest_score = current_score
             detected_emotion = emotion
 
+    return detected_emotion, highest_score
+
+async def update_emotion(user_id: int, user_text: str, aimi_response: str) -> str:
+    """
+    Analisa o texto do usuário, determina a nova emoção e a salva no cache.
+    """
+    detected_emotion, highest_score = detect_emotion(user_text)
+
     # Se uma nova emoção foi detectada, atualiza no cache
     if highest_score > 0:
         logger.info(f"[Emotion Update] Emoção de {user_id} alterada para: {detected_emotion} (Score: {highest_score})")
@@ -108,6 +117,17 @@ async def update_emotion(user_id: int, user_text: str, aimi_response: str) -> st
     # Se nada foi detectado, retorna a emoção que já estava no cache
     return await get_current_emotion(user_id)
 
+def update_session_emotion(session, user_text: str) -> str:
+    """
+    Versão de `update_emotion` para uma sessão já carregada (`utils/session.py`):
+    a nova emoção só é gravada no `session.save`, junto com o resto.
+    """
+    detected_emotion, highest_score = detect_emotion(user_text)
+    if highest_score > 0:
+        logger.info(f"[Emotion Update] Emoção de {session.user_id} alterada para: {detected_emotion} (Score: {highest_score})")
+        session.set_emotion(detected_emotion, EMOTION_CACHE_TTL)
+    return session.emotion
+
 async def handle_reaction(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     Handler para reações não-textuais, como stickers.
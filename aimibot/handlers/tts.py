@@ -5,38 +5,81 @@ Handler de TTS (Text-to-Speech) - AimiBOT
 
 Responsável por converter texto em áudio com a voz da Aimi.
 Funcionalidades:
-1. Usa gTTS para gerar o áudio base.
-2. Usa FFmpeg para aplicar efeitos de pitch (tom) e speed (velocidade).
-3. Implementa um sistema de cache em Redis e no sistema de arquivos para
-   evitar gerar o mesmo áudio múltiplas vezes.
-4. Opera de forma assíncrona para não bloquear o bot.
+1. Gera o áudio base com o motor de TTS do idioma (gTTS ou espeak-ng local,
+   ver `tts_backends.py`), sempre fora do event loop.
+2. Aplica os efeitos de pitch (tom) e speed (velocidade) e codifica em Opus no
+   próprio processo (PyAV, ver `audio_fx.py`), ou com o FFmpeg por pipes se o
+   PyAV não estiver disponível (nenhum arquivo temporário em nenhum dos casos).
+3. Guarda os áudios gerados em um cache em disco com tamanho limitado
+   (`utils/audio_cache.py`) para evitar gerar o mesmo áudio múltiplas vezes.
+4. Evita renderizações duplicadas: pedidos simultâneos do mesmo áudio esperam
+   uma única renderização (no processo e entre réplicas, via lock no Redis).
+5. Guarda o `file_id` que o Telegram devolve no primeiro envio de cada áudio,
+   para que os envios seguintes não precisem subir o arquivo de novo.
+6. No modo por frases (`VOICE_CONFIG['chunked']`), renderiza cada frase em
+   paralelo (inclusive enquanto o LLM ainda está gerando), com cache por frase,
+   e junta tudo em uma única mensagem de voz.
+7. Pré-renderiza na inicialização a voz das frases fixas (`config.VOICE_PHRASES`)
+   e a mantém em memória; saudações com o nome do usuário só renderizam o trecho
+   personalizado.
+8. Opera de forma assíncrona para não bloquear o bot.
 """
 
 import logging
 import os
+import re
+import base64
 import hashlib
 import asyncio
-from gtts import gTTS
+from telegram.error import BadRequest
 
 # --- Importações Locais ---
 import config
+from handlers import audio_fx, tts_backends
 from utils import redis as cache
+from utils.audio_cache import AudioCache
 
 # --- Configuração do Logging ---
 logger = logging.getLogger(__name__)
 
 # --- Configuração do Cache de Áudio ---
-# Define o diretório onde os arquivos de áudio finais serão salvos.
+# Define o diretório onde os arquivos de áudio finais são guardados em cache.
 CACHE_DIR = os.path.join(os.path.dirname(__file__), '..', 'cache', 'audio')
-# Garante que o diretório de cache exista.
-os.makedirs(CACHE_DIR, exist_ok=True)
+audio_cache = None
+_maintenance_task = None
 
-# Tempo que o áudio fica no cache do Redis (em segundos). 1 semana.
-REDIS_CACHE_TTL = 60 * 60 * 24 * 7
+# Tempo que o `file_id` do Telegram de um áudio fica no cache (em segundos). 30 dias.
+FILE_ID_CACHE_TTL = 60 * 60 * 24 * 30
 
-async def generate_voice(text: str, user_id: int, emotion: str) -> str | None:
+# Tarefas em segundo plano (gravação no cache, aviso às outras réplicas): mantém as referências vivas.
+_background_tasks = set()
+
+# --- Renderização Única (Single-Flight) ---
+# Renderizações em andamento neste processo: hash -> Task com o áudio.
+_inflight_renders = {}
+# Validade do lock de renderização entre réplicas (em segundos).
+RENDER_LOCK_TTL = 60
+# Quanto tempo uma réplica espera o áudio de outra antes de renderizar por conta própria.
+RENDER_WAIT_TIMEOUT = 30
+# Por quanto tempo o áudio renderizado fica disponível no Redis para as réplicas que esperavam.
+RENDER_SHARE_TTL = 120
+
+# --- Frases Fixas ---
+# Voz pré-renderizada das frases de `config.VOICE_PHRASES`: chave -> áudio.
+_phrase_audio = {}
+_phrase_warm_task = None
+
+# --- Voz por Frases ---
+# Fim de frase: pontuação final (com aspas/parênteses de fechamento) seguida de espaço.
+_SENTENCE_END = re.compile(r"[.!?…]+[\"')\]]*\s+")
+
+async def generate_voice(text: str, user_id: int, emotion: str) -> bytes | None:
     """
-    Gera um arquivo de voz a partir de um texto, aplicando efeitos e usando cache.
+    Gera o áudio de voz a partir de um texto, aplicando efeitos e usando cache.
+
+    Todo o processamento é em memória: os bytes do motor de TTS entram no FFmpeg
+    pela entrada padrão e o Opus sai pela saída padrão. O arquivo de cache é
+    gravado em segundo plano, sem atrasar o envio.
 
     Args:
         text (str): O texto a ser convertido em voz.
@@ -44,78 +87,436 @@ async def generate_voice(text: str, user_id: int, emotion: str) -> str | None:
         emotion (str): A emoção atual da Aimi, para modular a voz.
 
     Returns:
-        str | None: O caminho absoluto para o arquivo de áudio gerado (.ogg) ou None se ocorrer um erro.
+        bytes | None: O áudio final (.ogg/Opus), pronto para o `reply_voice`, ou None se ocorrer um erro.
     """
     try:
         # --- ETAPA 1: Determinar Idioma e Parâmetros da Voz ---
-        # Por enquanto, usamos o padrão. No futuro, podemos detectar o idioma do usuário.
-        lang_code = config.VOICE_CONFIG.get("default_lang", "pt-br")
-        voice_params = config.VOICE_CONFIG["languages"].get(lang_code)
-        
-        if not voice_params:
-            logger.error(f"[TTS] Configurações de voz não encontradas para o idioma: {lang_code}")
+        settings = _get_voice_settings()
+        if settings is None:
             return None
+        lang_code, voice_params, backend = settings
 
         # --- ETAPA 2: Criar Chave de Cache e Verificar Redis ---
-        # A chave é um hash do conteúdo, garantindo que o mesmo texto/emoção/idioma
-        # sempre resulte no mesmo arquivo.
-        cache_key_hash = hashlib.md5(f"{text}-{lang_code}-{emotion}-{voice_params['pitch']}-{voice_params['speed']}".encode()).hexdigest()
-        cache_key = f"aimi:voice:{cache_key_hash}"
-        
-        cached_file_path = await cache.get(cache_key)
-        if cached_file_path and os.path.exists(cached_file_path):
-            logger.info(f"[TTS Cache] Áudio encontrado no cache Redis para a chave: {cache_key}")
-            return cached_file_path
-
-        # --- ETAPA 3: Gerar Áudio Base com gTTS ---
-        # Define os nomes dos arquivos temporário (input) e final (output).
-        base_audio_path = os.path.join(CACHE_DIR, f"{cache_key_hash}_base.mp3")
-        final_audio_path = os.path.join(CACHE_DIR, f"{cache_key_hash}.ogg")
-
-        logger.info(f"[TTS] Gerando áudio base para: '{text[:30]}...'")
-        tts_obj = gTTS(text=text, lang=lang_code, tld=voice_params['tld'], slow=False)
-        tts_obj.save(base_audio_path)
-
-        # --- ETAPA 4: Processar Áudio com FFmpeg ---
-        # Constrói o comando do FFmpeg para alterar pitch e velocidade.
-        # Usamos o codec 'libopus' que é ótimo para voz no Telegram.
-        ffmpeg_command = [
-            'ffmpeg',
-            '-i', base_audio_path,
-            '-y',  # Sobrescrever arquivo de saída se existir
-            '-filter:a',
-            f"asetrate={44100 * voice_params['pitch']},atempo={voice_params['speed']}",
-            '-c:a', 'libopus',
-            '-b:a', '48k', # Bitrate de 48kbps, bom para voz
-            final_audio_path
-        ]
-
-        logger.info(f"[FFmpeg] Processando áudio com pitch={voice_params['pitch']} e speed={voice_params['speed']}")
-        
-        # Executa o comando FFmpeg de forma assíncrona.
+        cache_key_hash = _voice_cache_hash(text, emotion, *settings)
+
+        cached_audio = await asyncio.to_thread(_get_audio_cache().get, cache_key_hash)
+        if cached_audio:
+            logger.info(f"[TTS Cache] Áudio encontrado no cache em disco: {cache_key_hash}")
+            return cached_audio
+
+        # --- ETAPAS 3 a 5: Renderizar (uma única vez, mesmo com pedidos simultâneos) ---
+        return await _render_single_flight(cache_key_hash, lambda: _render_voice(text, cache_key_hash, *settings))
+
+    except tts_backends.TTSBackendError as e:
+        logger.error(f"[TTS Backend Error] {e}")
+        return None
+    except Exception as e:
+        logger.critical(f"[TTS Handler Error] Erro inesperado ao gerar voz: {e}", exc_info=True)
+        return None
+
+async def _render_voice(text: str, cache_key_hash: str, lang_code: str, voice_params: dict, backend) -> bytes | None:
+    """Gera o áudio base, aplica os efeitos e agenda a gravação no cache."""
+    # --- ETAPA 3: Gerar Áudio Base com o Motor de TTS ---
+    logger.info(f"[TTS] Gerando áudio base com '{backend.name}' para: '{text[:30]}...'")
+    # O motor bloqueia (rede ou subprocesso), então roda em uma thread separada.
+    base_audio = await asyncio.to_thread(backend.synthesize, text, lang_code, voice_params)
+
+    # --- ETAPA 4: Processar Áudio com FFmpeg ---
+    final_audio = await _apply_voice_effects(base_audio, backend.sample_rate, voice_params)
+    if not final_audio:
+        return None
+
+    # --- ETAPA 5: Cache (em segundo plano) ---
+    _in_background(_store_in_cache(cache_key_hash, final_audio))
+
+    return final_audio
+
+def _in_background(coro):
+    """Dispara uma tarefa sem esperar por ela, mantendo a referência até o fim."""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+async def _render_single_flight(cache_key_hash: str, render) -> bytes | None:
+    """
+    Garante uma única renderização por hash neste processo: quem chega enquanto
+    ela está em andamento espera o mesmo resultado em vez de renderizar de novo.
+    """
+    pending = _inflight_renders.get(cache_key_hash)
+    if pending is not None:
+        logger.info(f"[TTS] Renderização de {cache_key_hash} já em andamento. Aguardando o resultado.")
+    else:
+        # A renderização é uma tarefa própria, e não de quem chegou primeiro: se esse
+        # pedido for cancelado (ex: resposta substituída), os outros continuam esperando.
+        pending = asyncio.create_task(_render_across_replicas(cache_key_hash, render))
+        _inflight_renders[cache_key_hash] = pending
+        pending.add_done_callback(lambda done: _finish_render(cache_key_hash, done))
+    return await asyncio.shield(pending)
+
+def _finish_render(cache_key_hash: str, task: asyncio.Task):
+    """Tira a renderização da lista de andamento quando ela termina."""
+    if _inflight_renders.get(cache_key_hash) is task:
+        del _inflight_renders[cache_key_hash]
+    # Marca o erro como visto: se todos os pedidos foram cancelados, ninguém mais o lê.
+    if not task.cancelled():
+        task.exception()
+
+async def _render_across_replicas(cache_key_hash: str, render) -> bytes | None:
+    """
+    Coordena a renderização entre réplicas do bot com um lock no Redis. Quem pega o
+    lock renderiza e devolve o áudio na hora; deixar o áudio no Redis (só se alguma
+    réplica estiver esperando), avisar pelo canal e liberar o lock ficam para
+    segundo plano. As outras réplicas esperam o aviso; se a espera estourar o
+    prazo (ou o aviso vier sem áudio), a réplica renderiza por conta própria.
+    """
+    lock_key = f"aimi:voice_lock:{cache_key_hash}"
+    shared_key = f"aimi:voice_render:{cache_key_hash}"
+    channel = f"aimi:voice_done:{cache_key_hash}"
+
+    token = await cache.acquire_lock(lock_key, RENDER_LOCK_TTL)
+    if token is None:
+        logger.info(f"[TTS] Outra réplica está renderizando {cache_key_hash}. Aguardando a notificação.")
+
+        async def check():
+            # Cobre o que aconteceu antes da inscrição no canal: o áudio já pronto ou, se o
+            # lock já foi liberado sem áudio compartilhado, o aviso que não vai mais chegar.
+            shared, lock = await cache.execute_batch([("get", shared_key), ("get", lock_key)]) or (None, None)
+            if shared:
+                return shared
+            return "failed" if lock is None else None
+
+        result = await cache.wait_for_message(channel, RENDER_WAIT_TIMEOUT, check=check)
+        if result == "done":
+            result = await cache.get(shared_key)
+        if result and result != "failed":
+            # O áudio fica em base64 no Redis (o pool decodifica as respostas como texto).
+            return base64.b64decode(result)
+        logger.warning(f"[TTS] Sem o áudio de {cache_key_hash} vindo da outra réplica. Renderizando localmente.")
+        return await render()
+
+    audio = None
+    try:
+        audio = await render()
+        return audio
+    finally:
+        # Sempre avisa (inclusive se a renderização falhou ou foi cancelada), para que
+        # as outras réplicas não esperem até o `RENDER_WAIT_TIMEOUT`.
+        _in_background(_share_render(cache_key_hash, token, audio))
+
+async def _share_render(cache_key_hash: str, token: str, audio: bytes | None):
+    """Entrega o áudio às réplicas que esperam por ele e libera o lock de renderização."""
+    shared_key = f"aimi:voice_render:{cache_key_hash}"
+    channel = f"aimi:voice_done:{cache_key_hash}"
+    try:
+        # Sem ninguém inscrito no canal, o áudio não é copiado para o Redis. ("failed"
+        # significa só "sem áudio compartilhado": quem se inscrever depois renderiza sozinho.)
+        if audio and await cache.count_subscribers(channel):
+            shared = await cache.execute_batch([
+                ("setex", shared_key, RENDER_SHARE_TTL, base64.b64encode(audio).decode()),
+                ("publish", channel, "done")
+            ])
+            if shared is not None:
+                return
+        await cache.publish(channel, "failed")
+    finally:
+        await cache.release_lock(f"aimi:voice_lock:{cache_key_hash}", token)
+
+class VoiceComposer:
+    """
+    Monta a voz de uma resposta por frases, à medida que o texto chega.
+
+    Cada frase completa recebida por `feed` começa a ser renderizada na hora (em
+    paralelo com as outras e com a geração do texto). `finish` renderiza o resto
+    e junta os pedaços em uma única mensagem de voz. Cada frase passa pelo
+    `generate_voice`, então fica no cache sozinha e é reaproveitada em outras respostas.
+    """
+
+    def __init__(self, user_id: int, emotion: str):
+        self._user_id = user_id
+        self._emotion = emotion
+        self._buffer = ""
+        self._renders = []
+
+    def feed(self, text: str):
+        """Recebe mais um pedaço do texto e dispara a renderização das frases completas."""
+        self._buffer += text
+        min_chars = config.VOICE_CONFIG.get('min_chunk_chars', 20)
+        start = 0
+        for match in _SENTENCE_END.finditer(self._buffer):
+            sentence = self._buffer[start:match.end()].strip()
+            # Frases muito curtas ("Ah!") esperam a próxima, para não picotar a voz.
+            if len(sentence) >= min_chars:
+                self._render(sentence)
+                start = match.end()
+        self._buffer = self._buffer[start:]
+
+    async def finish(self) -> bytes | None:
+        """Renderiza o texto restante e retorna a voz completa (ou None se algum pedaço falhar)."""
+        if self._buffer.strip():
+            self._render(self._buffer.strip())
+            self._buffer = ""
+        parts = await asyncio.gather(*self._renders)
+        if not parts or None in parts:
+            return None
+        if len(parts) == 1:
+            return parts[0]
+        return await _concat_audio(parts)
+
+    def cancel(self):
+        """Cancela as renderizações em andamento (ex: a resposta foi descartada)."""
+        for render in self._renders:
+            render.cancel()
+
+    def _render(self, sentence: str):
+        self._renders.append(asyncio.ensure_future(
+            generate_voice(text=sentence, user_id=self._user_id, emotion=self._emotion)
+        ))
+
+async def generate_voice_chunked(text: str, user_id: int, emotion: str) -> bytes | None:
+    """Versão de `generate_voice` que renderiza as frases do texto em paralelo e junta o resultado."""
+    composer = VoiceComposer(user_id, emotion)
+    composer.feed(text)
+    return await composer.finish()
+
+async def _concat_audio(parts: list) -> bytes | None:
+    """
+    Junta vários áudios Opus em um só: no processo (PyAV) ou com o filtro `concat`
+    do FFmpeg, sem arquivos: cada pedaço entra por um pipe próprio (`pipe:N`),
+    escrito por uma thread.
+    """
+    if _use_in_process_effects():
+        try:
+            return await asyncio.to_thread(audio_fx.concat, parts)
+        except audio_fx.AudioEffectsError as e:
+            logger.warning(f"[TTS] {e}. Usando o FFmpeg.")
+
+    pipes = [os.pipe() for _ in parts]
+    read_fds = [read_fd for read_fd, _ in pipes]
+    inputs = [arg for read_fd in read_fds for arg in ('-i', f'pipe:{read_fd}')]
+    streams = "".join(f"[{index}:a]" for index in range(len(parts)))
+    ffmpeg_command = [
+        'ffmpeg',
+        '-loglevel', 'error',
+        *inputs,
+        '-filter_complex', f"{streams}concat=n={len(parts)}:v=0:a=1",
+        '-c:a', 'libopus',
+        '-b:a', '48k',
+        '-f', 'ogg',
+        'pipe:1'
+    ]
+
+    def write_part(write_fd: int, data: bytes):
+        try:
+            with open(write_fd, 'wb') as pipe:
+                pipe.write(data)
+        except BrokenPipeError:
+            pass # O FFmpeg falhou antes de ler tudo; o erro aparece no código de saída.
+
+    try:
         process = await asyncio.create_subprocess_exec(
             *ffmpeg_command,
             stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
+            stderr=asyncio.subprocess.PIPE,
+            pass_fds=read_fds
         )
-        stdout, stderr = await process.communicate()
+    except Exception:
+        for read_fd, write_fd in pipes:
+            os.close(read_fd)
+            os.close(write_fd)
+        raise
+    for read_fd in read_fds:
+        os.close(read_fd)
 
-        if process.returncode != 0:
-            logger.error(f"[FFmpeg Error] Falha ao processar o áudio. Código: {process.returncode}")
-            logger.error(f"[FFmpeg Stderr] {stderr.decode()}")
-            return None
+    writers = [asyncio.to_thread(write_part, write_fd, data) for (_, write_fd), data in zip(pipes, parts)]
+    (stdout, stderr), *_ = await asyncio.gather(process.communicate(), *writers)
 
-        # --- ETAPA 5: Limpeza e Cache ---
-        os.remove(base_audio_path)  # Remove o arquivo base, pois não é mais necessário.
-        await cache.setex(cache_key, REDIS_CACHE_TTL, final_audio_path) # Salva no Redis
-        logger.info(f"[TTS] Áudio gerado e salvo em: {final_audio_path}")
+    if process.returncode != 0 or not stdout:
+        logger.error(f"[FFmpeg Error] Falha ao juntar {len(parts)} pedaços de áudio. Código: {process.returncode}")
+        logger.error(f"[FFmpeg Stderr] {stderr.decode(errors='replace')}")
+        return None
+    return stdout
+
+async def send_voice(send, text: str, user_id: int, emotion: str, render=None) -> bool:
+    """
+    Envia a voz de um texto usando `send` (ex: `update.message.reply_voice`).
+
+    Se o mesmo áudio já foi enviado antes, reenvia só o `file_id` que o Telegram
+    devolveu da primeira vez, sem subir o arquivo. Senão, gera o áudio, envia e
+    guarda o `file_id` para os próximos envios. Retorna True se a voz foi enviada.
+
+    `render` (corrotina opcional) gera o áudio no lugar do padrão; ex: o `finish`
+    de um `VoiceComposer` que já vinha renderizando as frases.
+    """
+    settings = _get_voice_settings()
+    if settings is None:
+        return False
+    file_id_key = f"aimi:voice_id:{_voice_cache_hash(text, emotion, *settings)}"
 
-        return final_audio_path
+    file_id = await cache.get(file_id_key)
+    if file_id:
+        try:
+            await send(voice=file_id)
+            logger.info(f"[TTS Cache] Voz reenviada pelo file_id do Telegram: {file_id_key}")
+            return True
+        except BadRequest as e:
+            # O Telegram não reconhece mais esse file_id: esquece e sobe o áudio de novo.
+            logger.warning(f"[TTS Cache] file_id inválido para {file_id_key}: {e}")
+            await cache.delete(file_id_key)
 
+    if render is not None:
+        voice_audio = await render()
+    elif config.VOICE_CONFIG.get('chunked'):
+        voice_audio = await generate_voice_chunked(text=text, user_id=user_id, emotion=emotion)
+    else:
+        voice_audio = await generate_voice(text=text, user_id=user_id, emotion=emotion)
+    if not voice_audio:
+        return False
+    message = await send(voice=voice_audio)
+    if message is not None and message.voice is not None:
+        await cache.setex(file_id_key, FILE_ID_CACHE_TTL, message.voice.file_id)
+    return True
+
+async def send_phrase(send, key: str, user_id: int, first_name: str | None = None) -> bool:
+    """
+    Envia a voz de uma frase fixa de `config.VOICE_PHRASES` (pré-renderizada na
+    inicialização). Se a frase tiver saudação e `first_name` for dado, só a
+    saudação é renderizada na hora e vai na frente da parte fixa.
+    Falhas só são registradas: a voz de uma frase fixa nunca interrompe o fluxo.
+    """
+    phrase = config.VOICE_PHRASES[key]
+    text = phrase['text']
+    render = lambda: _phrase_voice(key)
+    if first_name and phrase.get('greeting') and config.VOICE_CONFIG.get('personalized_greeting', True):
+        greeting = phrase['greeting'].format(first_name=first_name)
+        text = f"{greeting} {text}"
+        render = lambda: _greeting_voice(greeting, key, user_id)
+
+    try:
+        return await send_voice(send, text=text, user_id=user_id, emotion=phrase['emotion'], render=render)
     except Exception as e:
-        logger.critical(f"[TTS Handler Error] Erro inesperado ao gerar voz: {e}", exc_info=True)
-        # Limpa arquivos temporários em caso de erro
-        if 'base_audio_path' in locals() and os.path.exists(base_audio_path):
-            os.remove(base_audio_path)
+        logger.error(f"[TTS] Falha ao enviar a voz da frase '{key}': {e}")
+        return False
+
+async def _phrase_voice(key: str) -> bytes | None:
+    """Voz da frase fixa: da memória ou, se ainda não foi pré-renderizada, gerada agora (e guardada)."""
+    audio = _phrase_audio.get(key)
+    if audio is None:
+        phrase = config.VOICE_PHRASES[key]
+        audio = await generate_voice(text=phrase['text'], user_id=0, emotion=phrase['emotion'])
+        if audio:
+            _phrase_audio[key] = audio
+    return audio
+
+async def _greeting_voice(greeting: str, key: str, user_id: int) -> bytes | None:
+    """Renderiza só a saudação personalizada e a junta com a parte fixa da frase."""
+    emotion = config.VOICE_PHRASES[key]['emotion']
+    parts = await asyncio.gather(generate_voice(text=greeting, user_id=user_id, emotion=emotion), _phrase_voice(key))
+    if None in parts:
         return None
+    return await _concat_audio(parts)
 
+def _get_voice_settings() -> tuple | None:
+    """Retorna `(idioma, parâmetros da voz, motor de TTS)` ou None se o idioma não estiver configurado."""
+    # Por enquanto, usamos o padrão. No futuro, podemos detectar o idioma do usuário.
+    lang_code = config.VOICE_CONFIG.get("default_lang", "pt-br")
+    voice_params = config.VOICE_CONFIG["languages"].get(lang_code)
+    if not voice_params:
+        logger.error(f"[TTS] Configurações de voz não encontradas para o idioma: {lang_code}")
+        return None
+    backend = tts_backends.get_backend(voice_params, config.VOICE_CONFIG.get("default_engine", tts_backends.DEFAULT_BACKEND))
+    return lang_code, voice_params, backend
+
+def _voice_cache_hash(text: str, emotion: str, lang_code: str, voice_params: dict, backend) -> str:
+    """
+    Hash do conteúdo do áudio, garantindo que o mesmo texto/emoção/idioma/motor
+    sempre resulte na mesma chave (do arquivo e do file_id).
+    """
+    return hashlib.md5(f"{text}-{lang_code}-{emotion}-{voice_params['pitch']}-{voice_params['speed']}-{backend.name}".encode()).hexdigest()
+
+def _use_in_process_effects() -> bool:
+    """True se os efeitos devem rodar no processo (PyAV) em vez de um subprocesso do FFmpeg."""
+    engine = config.VOICE_CONFIG.get('effects_engine', 'auto')
+    return engine != 'ffmpeg' and audio_fx.available()
+
+async def _apply_voice_effects(base_audio: bytes, sample_rate: int, voice_params: dict) -> bytes | None:
+    """
+    Aplica pitch (tom) e speed (velocidade) e codifica em Opus. Usa o PyAV no
+    próprio processo quando disponível; senão (ou se ele falhar), o FFmpeg por
+    pipes: o áudio base entra pela entrada padrão e o Opus sai pela saída padrão.
+    """
+    if _use_in_process_effects():
+        try:
+            # CPU pura: roda em uma thread para não travar o event loop.
+            return await asyncio.to_thread(audio_fx.apply_effects, base_audio, sample_rate, voice_params)
+        except audio_fx.AudioEffectsError as e:
+            logger.warning(f"[TTS] {e}. Usando o FFmpeg.")
+
+    ffmpeg_command = audio_fx.ffmpeg_effects_command(sample_rate, voice_params)
+
+    logger.info(f"[FFmpeg] Processando áudio com pitch={voice_params['pitch']} e speed={voice_params['speed']}")
+
+    # Executa o comando FFmpeg de forma assíncrona.
+    process = await asyncio.create_subprocess_exec(
+        *ffmpeg_command,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await process.communicate(input=base_audio)
+
+    if process.returncode != 0 or not stdout:
+        logger.error(f"[FFmpeg Error] Falha ao processar o áudio. Código: {process.returncode}")
+        logger.error(f"[FFmpeg Stderr] {stderr.decode(errors='replace')}")
+        return None
+    return stdout
+
+def _get_audio_cache() -> AudioCache:
+    """Inicializa o cache de áudio em disco se ainda não existir."""
+    global audio_cache
+    if audio_cache is None:
+        audio_cache = AudioCache(CACHE_DIR, config.AUDIO_CACHE_CONFIG['max_disk_mb'] * 1024 * 1024)
+    return audio_cache
+
+async def _store_in_cache(cache_key_hash: str, audio: bytes):
+    """Grava o áudio no cache em disco."""
+    try:
+        await asyncio.to_thread(_get_audio_cache().put, cache_key_hash, audio)
+        logger.info(f"[TTS] Áudio gerado e salvo no cache: {cache_key_hash}")
+    except Exception as e:
+        logger.error(f"[TTS Cache Error] Falha ao salvar o áudio em cache: {e}")
+
+# --- Manutenção do Cache ---
+
+async def start():
+    """
+    Inicia, em segundo plano, a pré-renderização das frases fixas e a manutenção
+    do cache de áudio (reconcilia o índice com o disco e, depois, remove arquivos
+    órfãos periodicamente). Deve ser chamada na inicialização da aplicação.
+    """
+    global _maintenance_task, _phrase_warm_task
+    if _phrase_warm_task is None:
+        _phrase_warm_task = asyncio.create_task(_warm_phrases())
+    if _maintenance_task is None:
+        _maintenance_task = asyncio.create_task(_maintain_audio_cache())
+
+async def _warm_phrases():
+    """Renderiza (ou lê do cache em disco) a voz de todas as frases fixas e a guarda em memória."""
+    keys = list(config.VOICE_PHRASES)
+    results = await asyncio.gather(*(_phrase_voice(key) for key in keys), return_exceptions=True)
+    failed = [key for key, audio in zip(keys, results) if not isinstance(audio, bytes)]
+    if failed:
+        logger.warning(f"[TTS] Não foi possível pré-renderizar as frases: {', '.join(failed)} (serão geradas no primeiro uso).")
+    logger.info(f"[TTS] {len(keys) - len(failed)} frase(s) fixa(s) pré-renderizada(s) em memória.")
+
+async def _maintain_audio_cache():
+    store = _get_audio_cache()
+    try:
+        await asyncio.to_thread(store.reconcile)
+    except Exception as e:
+        logger.error(f"[TTS Cache Error] Falha ao reconciliar o cache de áudio: {e}", exc_info=True)
+    while True:
+        try:
+            await asyncio.to_thread(store.cleanup_orphans)
+        except Exception as e:
+            logger.error(f"[TTS Cache Error] Falha na limpeza do cache de áudio: {e}", exc_info=True)
+        await asyncio.sleep(config.AUDIO_CACHE_CONFIG.get('cleanup_interval_minutes', 60) * 60)
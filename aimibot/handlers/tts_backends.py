@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+"""
+Motores de TTS - AimiBOT
+
+Cada motor converte texto no áudio base (antes dos efeitos do FFmpeg). O motor
+de cada idioma é escolhido em `VOICE_CONFIG` (chave "engine"):
+
+- "gtts": Google Text-to-Speech. Boa qualidade, mas depende de rede.
+- "espeak": espeak-ng local. Roda na CPU, sem rede e com latência previsível.
+
+As funções `synthesize` são bloqueantes (rede ou subprocesso) e devem ser
+chamadas fora do event loop (ex: `asyncio.to_thread`), como faz o `tts.py`.
+"""
+
+import abc
+import io
+import logging
+import shutil
+import subprocess
+
+from gtts import gTTS
+
+# --- Configuração do Logging ---
+logger = logging.getLogger(__name__)
+
+
+class TTSBackendError(Exception):
+    """O motor de TTS não conseguiu gerar o áudio."""
+
+
+class TTSBackend(abc.ABC):
+    """Interface dos motores de TTS."""
+
+    name = "base"
+    # Taxa de amostragem usada como referência no filtro `asetrate` do FFmpeg.
+    sample_rate = 44100
+
+    @abc.abstractmethod
+    def synthesize(self, text: str, lang_code: str, voice_params: dict) -> bytes:
+        """Gera o áudio base e retorna seus bytes (em um formato que o FFmpeg reconheça)."""
+
+
+class GTTSBackend(TTSBackend):
+    """Google Text-to-Speech (MP3, via HTTP)."""
+
+    name = "gtts"
+
+    def synthesize(self, text: str, lang_code: str, voice_params: dict) -> bytes:
+        buffer = io.BytesIO()
+        try:
+            gTTS(text=text, lang=lang_code, tld=voice_params.get('tld', 'com'), slow=False).write_to_fp(buffer)
+        except Exception as e:
+            raise TTSBackendError(f"gTTS falhou: {e}") from e
+        return buffer.getvalue()
+
+
+class EspeakBackend(TTSBackend):
+    """espeak-ng local (WAV pela saída padrão, sem rede)."""
+
+    name = "espeak"
+    sample_rate = 22050
+    TIMEOUT = 30
+
+    def __init__(self):
+        self.executable = shutil.which("espeak-ng") or shutil.which("espeak")
+
+    def synthesize(self, text: str, lang_code: str, voice_params: dict) -> bytes:
+        if not self.executable:
+            raise TTSBackendError("espeak-ng não está instalado.")
+        voice = voice_params.get('espeak_voice', lang_code)
+        try:
+            # O texto (vindo do LLM) vai pela entrada padrão, nunca nos argumentos: um
+            # texto começando com "-" seria lido como opção (ex: "-f arquivo" leria o arquivo).
+            result = subprocess.run(
+                [self.executable, '-v', voice, '--stdout', '--stdin'],
+                input=text.encode(),
+                capture_output=True,
+                timeout=self.TIMEOUT,
+                check=True
+            )
+        except subprocess.CalledProcessError as e:
+            raise TTSBackendError(f"espeak-ng falhou: {e.stderr.decode(errors='replace')}") from e
+        except subprocess.TimeoutExpired as e:
+            raise TTSBackendError("espeak-ng excedeu o tempo limite.") from e
+        return result.stdout
+
+
+# --- Registro dos Motores ---
+BACKENDS = {backend.name: backend for backend in (GTTSBackend(), EspeakBackend())}
+DEFAULT_BACKEND = "gtts"
+
+
+def get_backend(voice_params: dict, default: str = DEFAULT_BACKEND) -> TTSBackend:
+    """Retorna o motor configurado para o idioma (ou o padrão, se não houver/for desconhecido)."""
+    name = voice_params.get('engine', default)
+    backend = BACKENDS.get(name)
+    if backend is None:
+        logger.warning(f"[TTS] Motor de TTS desconhecido '{name}'. Usando '{default}'.")
+        backend = BACKENDS[default]
+    return backend
@@ -29,7 +29,9 @@ from telegram.ext import (
 # --- Importações Locais ---
 # Importa as configurações e os módulos de handlers que criaramos a seguir.
 import config
+from ai_core import llm
 from handlers import commands, chat, emotion, stripe, tts
+from utils import pg as db
 
 # --- Configuração do Logging ---
 # Define um sistema de log para sabermos o que o bot está fazendo e identificar erros.
@@ -53,6 +55,31 @@ async def error_handler(update, context):
     logger.error("Exceção ao processar uma atualização:", exc_info=context.error)
 
 
+async def post_init(application: Application) -> None:
+    """
+    Executada pela aplicação antes de começar a receber atualizações.
+
+    Carrega e aquece o modelo de IA aqui, para que o primeiro usuário depois de
+    um deploy não pague a carga do modelo e para que falhas apareçam na hora.
+    """
+    logger.info("Carregando e aquecendo o modelo de IA antes de aceitar mensagens...")
+    await llm.start()
+    # A manutenção do cache de áudio (reconciliação e limpeza) roda em segundo plano.
+    await tts.start()
+
+
+async def post_shutdown(application: Application) -> None:
+    """
+    Executada pela aplicação depois de parar de receber atualizações.
+
+    Encerra os workers do modelo e grava no banco o que ainda está em buffer
+    (ex: atividade dos usuários) antes de sair.
+    """
+    llm.stop()
+    logger.info("Gravando dados pendentes antes de desligar...")
+    await db.close()
+
+
 async def main():
     """
     Função principal que configura e inicia o bot.
@@ -60,7 +87,9 @@ async def main():
     logger.info("Iniciando o AimiBOT...")
     
     # Cria a aplicação do bot usando o token do Telegram.
-    application = ApplicationBuilder().token(config.TELEGRAM_TOKEN).build()
+    # O `post_init` garante que o modelo esteja pronto antes do polling começar.
+    # O `post_shutdown` grava os dados em buffer quando o bot é desligado.
+    application = ApplicationBuilder().token(config.TELEGRAM_TOKEN).post_init(post_init).post_shutdown(post_shutdown).build()
 
     # --- Registro dos Handlers ---
     # Cada handler é associado a um tipo de evento (comando, texto, etc.)
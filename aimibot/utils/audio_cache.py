@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+
+"""
+Cache de Áudio em Disco - AimiBOT
+
+Guarda os áudios finais (.ogg) gerados pelo TTS, com tamanho limitado:
+
+- Os arquivos ficam em subdiretórios pelo início do hash (`ab/cd/abcd....ogg`),
+  para que nenhum diretório acumule milhões de entradas.
+- Um índice SQLite (`index.sqlite`) guarda o tamanho e o último acesso de cada
+  áudio. Quando o total passa do orçamento de bytes, os menos usados recentemente
+  são apagados (LRU) até sobrar `LOW_WATERMARK` do orçamento.
+- Na inicialização, o índice é reconciliado com o disco: arquivos sem registro
+  entram no índice e registros sem arquivo saem. Arquivos do formato antigo
+  (direto na raiz do cache) são movidos para os subdiretórios.
+- Uma limpeza periódica remove restos de gravações interrompidas (`.part`) e
+  os áudios base (`{hash}_base.mp3`) que a versão antiga do TTS deixava para
+  trás quando falhava.
+
+O próprio disco é a fonte da verdade: uma busca só olha se o arquivo existe, então
+nunca aponta para um áudio que sumiu. Todas as operações são bloqueantes e
+thread-safe; o `tts.py` as chama fora do event loop.
+"""
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# --- Configuração do Logging ---
+logger = logging.getLogger(__name__)
+
+# Depois de estourar o orçamento, apaga os mais antigos até sobrar esta fração dele.
+LOW_WATERMARK = 0.9
+# Restos `.part` mais velhos que isso são considerados órfãos (em segundos).
+PARTIAL_FILE_MAX_AGE = 60 * 10
+# Nome dos arquivos de áudio: hash md5 + extensão.
+_AUDIO_FILE = re.compile(r"^([0-9a-f]{32})\.ogg$")
+# Áudio base intermediário do formato antigo (nunca é criado hoje; sempre órfão).
+_LEGACY_BASE_FILE = re.compile(r"^[0-9a-f]{32}_base\.mp3$")
+
+
+class AudioCache:
+    """Cache LRU de áudios em disco, com orçamento de bytes e índice SQLite."""
+
+    def __init__(self, root_dir: str, max_bytes: int):
+        self._root = root_dir
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(self._root, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(self._root, "index.sqlite"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # Com WAL, NORMAL não sincroniza o disco a cada commit (cada busca grava o último
+        # acesso). Uma queda de energia pode perder os últimos acessos, nunca corromper o índice.
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+        self._db.commit()
+        self._total_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    # --- API Pública ---
+
+    def path_for(self, key: str) -> str:
+        """Caminho do arquivo de um áudio (subdiretórios pelos 4 primeiros caracteres do hash)."""
+        return os.path.join(self._root, key[:2], key[2:4], f"{key}.ogg")
+
+    def get(self, key: str) -> bytes | None:
+        """Lê um áudio do cache e o marca como usado agora. None se não existir."""
+        try:
+            with open(self.path_for(key), 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        with self._lock:
+            self._db.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+        return data
+
+    def put(self, key: str, data: bytes):
+        """Grava um áudio (de uma vez, via renomeação) e aplica o orçamento de bytes."""
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        partial_path = f"{path}.part"
+        try:
+            with open(partial_path, 'wb') as f:
+                f.write(data)
+            os.replace(partial_path, path)
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+
+        with self._lock:
+            self._record(key, len(data), time.time())
+            self._db.commit()
+            if self._total_bytes > self._max_bytes:
+                self._evict(int(self._max_bytes * LOW_WATERMARK))
+
+    def reconcile(self):
+        """
+        Acerta o índice com o que existe no disco. Executada na inicialização (em
+        segundo plano): pode demorar com muitos arquivos, mas o cache funciona
+        normalmente enquanto isso.
+        """
+        started = time.monotonic()
+        on_disk = {}
+        for dir_path, _, file_names in os.walk(self._root):
+            for file_name in file_names:
+                match = _AUDIO_FILE.match(file_name)
+                if not match:
+                    continue
+                key = match.group(1)
+                path = os.path.join(dir_path, file_name)
+                if path != self.path_for(key):
+                    # Formato antigo (arquivos soltos na raiz): move para o subdiretório.
+                    os.makedirs(os.path.dirname(self.path_for(key)), exist_ok=True)
+                    os.replace(path, self.path_for(key))
+                    path = self.path_for(key)
+                stat = os.stat(path)
+                on_disk[key] = (stat.st_size, stat.st_mtime)
+
+        with self._lock:
+            indexed = {key for (key,) in self._db.execute("SELECT key FROM entries")}
+            # (Áudios gravados durante a varredura estão no índice e no disco: não são órfãos.)
+            missing = {key for key in indexed - on_disk.keys() if not os.path.exists(self.path_for(key))}
+            self._db.executemany("DELETE FROM entries WHERE key = ?", ((key,) for key in missing))
+            for key in on_disk.keys() - indexed:
+                size, mtime = on_disk[key]
+                self._db.execute("INSERT OR REPLACE INTO entries (key, size, last_access) VALUES (?, ?, ?)", (key, size, mtime))
+            self._total_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            self._db.commit()
+            if self._total_bytes > self._max_bytes:
+                self._evict(int(self._max_bytes * LOW_WATERMARK))
+
+        logger.info(
+            f"[Audio Cache] Índice reconciliado em {time.monotonic() - started:.1f}s: {len(on_disk)} arquivo(s), "
+            f"{len(on_disk.keys() - indexed)} adicionado(s), {len(missing)} registro(s) órfão(s) removido(s), "
+            f"{self._total_bytes / 1024 / 1024:.1f} MB em uso."
+        )
+
+    def cleanup_orphans(self) -> int:
+        """
+        Remove restos `.part` de gravações interrompidas e áudios base antigos
+        (`{hash}_base.mp3`). Retorna quantos arquivos foram apagados.
+        """
+        removed = 0
+        cutoff = time.time() - PARTIAL_FILE_MAX_AGE
+        for dir_path, _, file_names in os.walk(self._root):
+            for file_name in file_names:
+                legacy = bool(_LEGACY_BASE_FILE.match(file_name))
+                if not legacy and not file_name.endswith(".part"):
+                    continue
+                path = os.path.join(dir_path, file_name)
+                try:
+                    if legacy or os.stat(path).st_mtime < cutoff:
+                        os.remove(path)
+                        removed += 1
+                except OSError:
+                    continue
+        if removed:
+            logger.info(f"[Audio Cache] {removed} arquivo(s) parcial(is) órfão(s) removido(s).")
+        return removed
+
+    def stats(self) -> dict:
+        """Uso atual do cache."""
+        with self._lock:
+            count = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {"entries": count, "bytes": self._total_bytes, "max_bytes": self._max_bytes}
+
+    # --- Funções Internas ---
+
+    def _record(self, key: str, size: int, last_access: float):
+        """Insere ou atualiza um registro do índice, mantendo o total de bytes (com o lock)."""
+        row = self._db.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+        self._total_bytes += size - (row[0] if row else 0)
+        self._db.execute("INSERT OR REPLACE INTO entries (key, size, last_access) VALUES (?, ?, ?)", (key, size, last_access))
+
+    def _evict(self, target_bytes: int):
+        """Apaga os áudios menos usados recentemente até o total caber em `target_bytes` (com o lock)."""
+        evicted = 0
+        while self._total_bytes > target_bytes:
+            rows = self._db.execute("SELECT key, size FROM entries ORDER BY last_access LIMIT 256").fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                try:
+                    os.remove(self.path_for(key))
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    # Sai do índice mesmo assim; se o arquivo continuar lá, a próxima reconciliação o recoloca.
+                    logger.warning(f"[Audio Cache] Falha ao apagar o áudio {key}: {e}")
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._total_bytes -= size
+                evicted += 1
+                if self._total_bytes <= target_bytes:
+                    break
+        self._db.commit()
+        logger.info(f"[Audio Cache] {evicted} áudio(s) despejado(s) (LRU). Em uso: {self._total_bytes / 1024 / 1024:.1f} MB.")
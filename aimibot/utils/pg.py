@@ -8,12 +8,15 @@ Ele usa um pool de conexões assíncronas (`asyncpg`) para eficiência e
 centraliza todas as queries SQL, garantindo segurança e manutenibilidade.
 """
 
+import asyncio
+import json
 import logging
 import asyncpg
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 
 # --- Importações Locais ---
 import config
+from utils import redis as cache
 
 # --- Configuração do Logging ---
 logger = logging.getLogger(__name__)
@@ -21,6 +24,19 @@ logger = logging.getLogger(__name__)
 # --- Pool de Conexão Global ---
 db_pool = None
 
+# --- Cache de Acesso ---
+# A decisão de acesso só muda quando um plano é ativado (invalidação explícita) ou
+# quando o trial/plano vence (o TTL da chave termina exatamente nesse momento).
+# Decisões sem data de mudança prevista (ex: trial já expirado) valem por até este tempo.
+ACCESS_CACHE_MAX_TTL = 60 * 60 * 24
+
+# --- Buffer de Atividade (Write-Behind) ---
+# O `last_seen_at` de cada usuário é acumulado em memória e gravado em lote, com um
+# único UPDATE, a cada `ACTIVITY_FLUSH_INTERVAL` segundos (e no desligamento do bot).
+ACTIVITY_FLUSH_INTERVAL = 30
+_activity_buffer = {} # user_id -> último momento de atividade
+_activity_flusher = None
+
 async def _get_db_pool():
     """Inicializa o pool de conexões com o banco de dados se ainda não existir."""
     global db_pool
@@ -81,7 +97,7 @@ async def register_user_and_start_trial(user) -> (str, bool):
         existing_user = await conn.fetchrow("SELECT * FROM users WHERE user_id = $1", user.id)
 
         trial_duration = config.OPERATION_MODES['trial_duration_minutes']
-        trial_end_time = datetime.utcnow() + timedelta(minutes=trial_duration)
+        trial_end_time = datetime.now(timezone.utc) + timedelta(minutes=trial_duration)
 
         if not existing_user:
             is_new_user = True
@@ -90,35 +106,82 @@ async def register_user_and_start_trial(user) -> (str, bool):
                 VALUES ($1, $2, $3, $4)
             """, user.id, user.first_name, user.username, trial_end_time)
             logger.info(f"[DB] Novo usuário registrado: {user.first_name} (ID: {user.id}). Trial de {trial_duration} min iniciado.")
-            welcome_message = f"O-oi, senpai {user.first_name}! Meu nome é Aimi. Prazer em conhecer você! ❤️ Você tem {trial_duration} minutos para conversar comigo e testar minha voz!"
+            await invalidate_user_access(user.id)
+            welcome_message = _phrase_with_greeting("welcome_new", user.first_name)
         else:
-            await conn.execute("UPDATE users SET last_seen_at = NOW() WHERE user_id = $1", user.id)
+            record_activity(user.id)
             logger.info(f"[DB] Usuário recorrente: {user.first_name} (ID: {user.id}).")
-            welcome_message = f"Bem-vindo de volta, senpai {user.first_name}! Que bom te ver de novo! 🥰"
+            welcome_message = _phrase_with_greeting("welcome_back", user.first_name)
         
         return welcome_message, is_new_user
 
-async def check_user_access(user_id: int) -> (bool, str):
+def _phrase_with_greeting(key: str, first_name: str) -> str:
+    """Texto completo de uma frase fixa de `config.VOICE_PHRASES`, com a saudação personalizada."""
+    phrase = config.VOICE_PHRASES[key]
+    return f"{phrase['greeting'].format(first_name=first_name)} {phrase['text']}"
+
+def _access_cache_key(user_id: int) -> str:
+    return f"aimi:access:{user_id}"
+
+def _access_version_key(user_id: int) -> str:
+    # Incrementada a cada invalidação; protege o cache de gravações atrasadas.
+    return f"aimi:access_version:{user_id}"
+
+async def check_user_access(user_id: int) -> (bool, str, str):
     """
     Verifica se um usuário tem permissão para interagir com a IA.
-    Retorna (True, "OK") ou (False, "Motivo da recusa").
+    Retorna (True, "OK", plano) ou (False, "Motivo da recusa", None).
+    O plano é o plano pago ativo ou "trial", e define a prioridade na fila da IA.
+
+    A decisão fica em cache no Redis até o próximo vencimento (trial ou plano), então
+    o banco só é consultado quando ela pode ter mudado. A versão de acesso do usuário
+    é lida junto; se `invalidate_user_access` rodar durante a consulta ao banco (ex:
+    um plano ativado), a decisão lida antes não é gravada no cache.
     """
+    cached, version = await cache.execute_batch([
+        ("get", _access_cache_key(user_id)),
+        ("get", _access_version_key(user_id))
+    ]) or (None, None)
+    if cached:
+        return tuple(json.loads(cached))
+
     pool = await _get_db_pool()
     async with pool.acquire() as conn:
         user_data = await conn.fetchrow("SELECT current_plan, trial_ends_at, plan_expires_at FROM users WHERE user_id = $1", user_id)
-        if not user_data:
-            return False, "Você não está registrado. Use /start para começar."
 
-        # 1. Verifica se tem um plano ativo
-        if user_data['current_plan'] != 'free' and user_data['plan_expires_at'] and user_data['plan_expires_at'] > datetime.utcnow():
-            return True, "OK"
+    now = datetime.now(timezone.utc)
+    if not user_data:
+        access = (False, "Você não está registrado. Use /start para começar.", None)
+    # 1. Verifica se tem um plano ativo
+    elif user_data['current_plan'] != 'free' and user_data['plan_expires_at'] and user_data['plan_expires_at'] > now:
+        access = (True, "OK", user_data['current_plan'])
+    # 2. Verifica se o trial ainda está ativo
+    elif config.OPERATION_MODES['modo_trial_ativo'] and user_data['trial_ends_at'] and user_data['trial_ends_at'] > now:
+        access = (True, "OK", "trial")
+    # 3. Se nenhuma das condições acima for atendida, o acesso é negado.
+    else:
+        access = (False, "Seu tempo de trial acabou, senpai... 😢 Para continuarmos conversando, por favor, considere um dos meus planos! Use /planos para ver as opções.", None)
 
-        # 2. Verifica se o trial ainda está ativo
-        if config.OPERATION_MODES['modo_trial_ativo'] and user_data['trial_ends_at'] and user_data['trial_ends_at'] > datetime.utcnow():
-            return True, "OK"
+    # A decisão vale até o próximo vencimento (o que vier primeiro entre trial e plano).
+    ttl = ACCESS_CACHE_MAX_TTL
+    if user_data:
+        upcoming = [at for at in (user_data['trial_ends_at'], user_data['plan_expires_at']) if at and at > now]
+        if upcoming:
+            ttl = min(ttl, int((min(upcoming) - now).total_seconds()))
+    if ttl > 0:
+        await cache.setex_if_version(_access_cache_key(user_id), ttl, json.dumps(access), _access_version_key(user_id), version)
+    return access
 
-        # 3. Se nenhuma das condições acima for atendida, o acesso é negado.
-        return False, "Seu tempo de trial acabou, senpai... 😢 Para continuarmos conversando, por favor, considere um dos meus planos! Use /planos para ver as opções."
+async def invalidate_user_access(user_id: int):
+    """
+    Descarta a decisão de acesso em cache (ex: depois de ativar um plano) e
+    incrementa a versão, para que consultas já em andamento não a regravem.
+    """
+    await cache.execute_batch([
+        ("incr", _access_version_key(user_id)),
+        ("expire", _access_version_key(user_id), ACCESS_CACHE_MAX_TTL),
+        ("delete", _access_cache_key(user_id))
+    ], transaction=True)
 
 async def get_user_status(user_id: int) -> str:
     """Busca e formata o status da conta de um usuário."""
@@ -131,7 +194,7 @@ async def get_user_status(user_id: int) -> str:
         status = f"**Status da sua Conta**\n\n**Plano Atual:** `{user_data['current_plan']}`\n"
         if user_data['current_plan'] != 'free':
             status += f"**Válido até:** `{user_data['plan_expires_at'].strftime('%d/%m/%Y %H:%M')}`\n"
-        elif user_data['trial_ends_at'] > datetime.utcnow():
+        elif user_data['trial_ends_at'] > datetime.now(timezone.utc):
              status += f"**Trial termina em:** `{user_data['trial_ends_at'].strftime('%d/%m/%Y %H:%M')}`\n"
         else:
             status += "_Seu trial já expirou._\n"
@@ -147,17 +210,73 @@ async def activate_user_plan(user_id: int, plan_key: str) -> bool:
     async with pool.acquire() as conn:
         try:
             plan_duration_days = 30 # Simplificado
-            new_expiry_date = datetime.utcnow() + timedelta(days=plan_duration_days)
+            new_expiry_date = datetime.now(timezone.utc) + timedelta(days=plan_duration_days)
             
             await conn.execute("""
                 UPDATE users 
-                SET current_plan = $1, plan_expires_at = $2, last_seen_at = NOW()
+                SET current_plan = $1, plan_expires_at = $2
                 WHERE user_id = $3
             """, plan_key, new_expiry_date, user_id)
+            record_activity(user_id)
             
             logger.info(f"[DB] Plano '{plan_key}' ativado para o usuário {user_id}. Válido até {new_expiry_date}.")
+            await invalidate_user_access(user_id)
             return True
         except Exception as e:
             logger.error(f"[DB Activate Plan Error] Falha ao ativar plano para {user_id}: {e}", exc_info=True)
             return False
 
+# --- Atividade dos Usuários (Write-Behind) ---
+
+def record_activity(user_id: int):
+    """
+    Registra que o usuário está ativo agora. Não toca no banco: o momento fica no
+    buffer e é gravado em lote pelo próximo `flush_activity`.
+    """
+    global _activity_flusher
+    _activity_buffer[user_id] = datetime.now(timezone.utc)
+    if _activity_flusher is None or _activity_flusher.done():
+        _activity_flusher = asyncio.get_running_loop().create_task(_flush_activity_periodically())
+
+async def flush_activity() -> int:
+    """Grava o buffer de atividade no banco com um único UPDATE. Retorna quantos usuários foram gravados."""
+    if not _activity_buffer:
+        return 0
+    batch = dict(_activity_buffer)
+    _activity_buffer.clear()
+    try:
+        pool = await _get_db_pool()
+        async with pool.acquire() as conn:
+            await conn.execute("""
+                UPDATE users
+                SET last_seen_at = GREATEST(users.last_seen_at, activity.seen_at)
+                FROM unnest($1::BIGINT[], $2::TIMESTAMPTZ[]) AS activity(user_id, seen_at)
+                WHERE users.user_id = activity.user_id
+            """, list(batch.keys()), list(batch.values()))
+        logger.debug(f"[DB] Atividade de {len(batch)} usuário(s) gravada em lote.")
+        return len(batch)
+    except Exception as e:
+        logger.error(f"[DB Activity Error] Falha ao gravar a atividade de {len(batch)} usuário(s): {e}", exc_info=True)
+        # Devolve ao buffer para a próxima tentativa, sem sobrescrever atividades mais novas.
+        for user_id, seen_at in batch.items():
+            if _activity_buffer.get(user_id, seen_at) <= seen_at:
+                _activity_buffer[user_id] = seen_at
+        return 0
+
+async def _flush_activity_periodically():
+    """Tarefa de fundo que esvazia o buffer de atividade em intervalos fixos."""
+    while True:
+        await asyncio.sleep(ACTIVITY_FLUSH_INTERVAL)
+        await flush_activity()
+
+async def close():
+    """Grava a atividade pendente e fecha o pool de conexões. Chamada no desligamento do bot."""
+    global _activity_flusher, db_pool
+    if _activity_flusher is not None:
+        _activity_flusher.cancel()
+        _activity_flusher = None
+    await flush_activity()
+    if db_pool is not None:
+        await db_pool.close()
+        db_pool = None
+        logger.info("[PostgreSQL] Pool de conexão fechado.")
@@ -6,9 +6,25 @@ Utilitário de Cache - Redis
 Este módulo centraliza a conexão e a interação com o servidor Redis.
 Ele fornece funções assíncronas para operações comuns de cache, como
 GET, SET, e manipulação de listas, usadas em várias partes do bot.
+
+Opcionalmente (`L1_CACHE_CONFIG`), leituras de chaves "quentes" passam por um
+cache L1 em memória. Ele se mantém coerente assim:
+- Toda gravação feita por este módulo em uma chave elegível (prefixos do
+  `L1_CACHE_CONFIG`) descarta a cópia local e publica a chave no canal
+  `L1_INVALIDATION_CHANNEL`, no mesmo pipeline da gravação; os outros processos
+  do bot descartam a sua.
+- Cada cópia local tem uma validade curta, que cobre expirações no servidor e
+  gravações feitas por fora do bot.
+- Enquanto o canal de invalidação estiver desconectado, o L1 não é usado.
+- Uma leitura que estava em andamento quando chegou uma invalidação não guarda
+  o que leu (pode ser o valor de antes da gravação): ver `_l1_epoch`.
 """
 
+import asyncio
 import logging
+import time
+import uuid
+from collections import OrderedDict
 import redis.asyncio as redis
 
 # --- Importações Locais ---
@@ -20,6 +36,23 @@ logger = logging.getLogger(__name__)
 # --- Pool de Conexão ---
 # Criar um pool de conexão é mais eficiente do que criar uma nova conexão a cada vez.
 redis_pool = None
+# Um único cliente (sem estado próprio além do pool) é reaproveitado por todas as chamadas.
+redis_client = None
+
+# --- Cache L1 (em memória) ---
+L1_INVALIDATION_CHANNEL = "aimi:l1:invalidate"
+L1_RECONNECT_DELAY = 5
+# Comandos de gravação: o primeiro argumento é a chave alterada.
+_WRITE_COMMANDS = {"set", "setex", "delete", "rpush", "ltrim", "expire"}
+_l1_entries = OrderedDict() # chave -> (valor, expira_em)
+# Incrementado a cada invalidação (local ou recebida). Uma leitura só guarda a cópia
+# local se nenhuma invalidação aconteceu entre o início e o fim da ida ao servidor.
+_l1_epoch = 0
+_l1_listener = None
+_l1_connected = False
+# Identifica este processo nas mensagens de invalidação (para ignorar as próprias).
+_l1_origin = uuid.uuid4().hex
+l1_stats = {"hits": 0, "misses": 0, "invalidations": 0}
 
 def _get_redis_pool():
     """Inicializa o pool de conexão Redis se ainda não existir."""
@@ -39,16 +72,133 @@ def _get_redis_pool():
     return redis_pool
 
 async def get_client():
-    """Retorna um cliente Redis do pool de conexão."""
-    return redis.Redis(connection_pool=_get_redis_pool())
+    """Retorna o cliente Redis compartilhado, criado sobre o pool de conexão."""
+    global redis_client
+    if redis_client is None:
+        redis_client = redis.Redis(connection_pool=_get_redis_pool())
+    return redis_client
+
+# --- Cache L1 ---
+
+def _l1_eligible(key: str) -> bool:
+    """Diz se a chave pode ser servida do L1 agora."""
+    if not config.L1_CACHE_CONFIG.get('enabled'):
+        return False
+    _start_l1_listener()
+    return _l1_connected and key.startswith(tuple(config.L1_CACHE_CONFIG['prefixes']))
+
+def _l1_get(key: str):
+    """Retorna `(True, valor)` se a chave estiver no L1 e válida; senão `(False, None)`."""
+    entry = _l1_entries.get(key)
+    if entry is None or entry[1] < time.monotonic():
+        l1_stats["misses"] += 1
+        return False, None
+    _l1_entries.move_to_end(key)
+    l1_stats["hits"] += 1
+    return True, entry[0]
+
+def _l1_put(key: str, value, epoch: int):
+    """
+    Guarda uma cópia local (inclusive de chaves inexistentes, como None), se não
+    houve invalidação desde `epoch` (o `_l1_epoch` de antes da leitura).
+    """
+    if epoch != _l1_epoch:
+        return
+    _l1_entries[key] = (value, time.monotonic() + config.L1_CACHE_CONFIG['ttl_seconds'])
+    _l1_entries.move_to_end(key)
+    while len(_l1_entries) > config.L1_CACHE_CONFIG['max_keys']:
+        _l1_entries.popitem(last=False)
+
+def _l1_drop(key: str) -> bool:
+    """Descarta a cópia local de uma chave e invalida as leituras em andamento."""
+    global _l1_epoch
+    _l1_epoch += 1
+    return _l1_entries.pop(key, None) is not None
+
+def _l1_invalidation_commands(keys: list) -> list:
+    """
+    Descarta as cópias locais das chaves e monta os comandos que avisam os outros
+    processos (para irem no mesmo pipeline da gravação).
+    """
+    if not config.L1_CACHE_CONFIG.get('enabled'):
+        return []
+    # Chaves fora dos prefixos nunca entram no L1: não há o que invalidar.
+    keys = [key for key in keys if key.startswith(tuple(config.L1_CACHE_CONFIG['prefixes']))]
+    for key in keys:
+        _l1_drop(key)
+    return [("publish", L1_INVALIDATION_CHANNEL, f"{_l1_origin}|{key}") for key in keys]
+
+async def _write(name: str, key: str, *args):
+    """
+    Executa uma gravação avulsa e retorna o resultado. Se a chave estiver no L1,
+    o aviso de invalidação vai no mesmo pipeline (uma única ida e volta).
+    """
+    r = await get_client()
+    invalidations = _l1_invalidation_commands([key])
+    if not invalidations:
+        return await getattr(r, name)(key, *args)
+    async with r.pipeline(transaction=False) as pipe:
+        getattr(pipe, name)(key, *args)
+        for command, *command_args in invalidations:
+            getattr(pipe, command)(*command_args)
+        return (await pipe.execute())[0]
+
+def _start_l1_listener():
+    """Inicia (uma vez) a tarefa que escuta as invalidações dos outros processos."""
+    global _l1_listener
+    if _l1_listener is None or _l1_listener.done():
+        _l1_listener = asyncio.get_running_loop().create_task(_listen_for_invalidations())
+
+async def _listen_for_invalidations():
+    """Escuta o canal de invalidação; se cair, limpa o L1 e reconecta."""
+    global _l1_connected, _l1_epoch
+    while True:
+        try:
+            pubsub = (await get_client()).pubsub()
+            await pubsub.subscribe(L1_INVALIDATION_CHANNEL)
+            _l1_connected = True
+            logger.info("[Redis L1] Escutando invalidações do cache local.")
+            async for message in pubsub.listen():
+                if message["type"] != "message":
+                    continue
+                origin, _, key = message["data"].partition("|")
+                if origin != _l1_origin and _l1_drop(key):
+                    l1_stats["invalidations"] += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"[Redis L1] Canal de invalidação desconectado: {e}")
+        # Mensagens podem ter sido perdidas: nenhuma cópia local é confiável.
+        _l1_connected = False
+        _l1_epoch += 1
+        _l1_entries.clear()
+        await asyncio.sleep(L1_RECONNECT_DELAY)
+
+def get_l1_stats() -> dict:
+    """Contadores do cache L1 (acertos, faltas, invalidações recebidas e chaves em memória)."""
+    total = l1_stats["hits"] + l1_stats["misses"]
+    return {
+        **l1_stats,
+        "hit_rate": l1_stats["hits"] / total if total else 0.0,
+        "keys": len(_l1_entries)
+    }
 
 # --- Funções de Wrapper para Comandos Comuns ---
 
 async def get(key: str) -> str | None:
-    """Busca um valor no cache Redis pela chave."""
+    """Busca um valor no cache Redis pela chave (passando pelo L1, se ativo)."""
+    use_l1 = _l1_eligible(key)
+    if use_l1:
+        found, value = _l1_get(key)
+        if found:
+            return value
+    epoch = _l1_epoch
     try:
         r = await get_client()
-        return await r.get(key)
+        value = await r.get(key)
+        if use_l1:
+            _l1_put(key, value, epoch)
+        return value
     except Exception as e:
         logger.error(f"[Redis GET Error] Falha ao buscar a chave '{key}': {e}")
         return None
@@ -56,18 +206,25 @@ async def get(key: str) -> str | None:
 async def setex(key: str, ttl_seconds: int, value: str) -> bool:
     """Define um valor no cache Redis com um tempo de expiração (TTL)."""
     try:
-        r = await get_client()
-        await r.setex(key, ttl_seconds, value)
+        await _write("setex", key, ttl_seconds, value)
         return True
     except Exception as e:
         logger.error(f"[Redis SETEX Error] Falha ao definir a chave '{key}': {e}")
         return False
 
+async def delete(key: str) -> bool:
+    """Remove uma chave do cache Redis."""
+    try:
+        await _write("delete", key)
+        return True
+    except Exception as e:
+        logger.error(f"[Redis DEL Error] Falha ao remover a chave '{key}': {e}")
+        return False
+
 async def rpush(key: str, value: str) -> int:
     """Adiciona um valor ao final de uma lista no Redis."""
     try:
-        r = await get_client()
-        return await r.rpush(key, value)
+        return await _write("rpush", key, value)
     except Exception as e:
         logger.error(f"[Redis RPUSH Error] Falha ao adicionar na lista '{key}': {e}")
         return 0
@@ -84,8 +241,7 @@ async def lrange(key: str, start: int, end: int) -> list:
 async def ltrim(key: str, start: int, end: int) -> bool:
     """Corta uma lista do Redis, mantendo apenas os itens entre start e end."""
     try:
-        r = await get_client()
-        await r.ltrim(key, start, end)
+        await _write("ltrim", key, start, end)
         return True
     except Exception as e:
         logger.error(f"[Redis LTRIM Error] Falha ao cortar a lista '{key}': {e}")
@@ -94,12 +250,193 @@ async def ltrim(key: str, start: int, end: int) -> bool:
 async def expire(key: str, ttl_seconds: int) -> bool:
     """Define um tempo de expiração para uma chave existente."""
     try:
-        r = await get_client()
-        await r.expire(key, ttl_seconds)
+        await _write("expire", key, ttl_seconds)
         return True
     except Exception as e:
         logger.error(f"[Redis EXPIRE Error] Falha ao definir TTL para a chave '{key}': {e}")
         return False
 
+# --- Operações em Lote ---
+
+async def execute_batch(commands: list, transaction: bool = False) -> list | None:
+    """
+    Executa vários comandos em uma única ida e volta ao servidor (pipeline).
+
+    `commands` é uma lista de tuplas `(comando, *args)`, ex: `("get", "aimi:emotion:1")`.
+    Com `transaction=True`, os comandos rodam em um MULTI/EXEC atômico.
+    Retorna os resultados na mesma ordem dos comandos, ou None em caso de falha.
+
+    Fora de transações, GETs de chaves no L1 são respondidos da memória; se todos
+    os comandos forem respondidos assim, nem há ida ao servidor.
+    """
+    if not commands:
+        return []
+    results = [None] * len(commands)
+    pending = []
+    for index, (name, *args) in enumerate(commands):
+        if not transaction and name == "get" and _l1_eligible(args[0]):
+            found, results[index] = _l1_get(args[0])
+            if found:
+                continue
+        pending.append(index)
+    if not pending:
+        return results
+
+    # Os avisos de invalidação do L1 vão no mesmo pipeline das gravações.
+    written_keys = dict.fromkeys(commands[index][1] for index in pending if commands[index][0] in _WRITE_COMMANDS)
+    invalidations = _l1_invalidation_commands(list(written_keys))
+    epoch = _l1_epoch
+    try:
+        r = await get_client()
+        async with r.pipeline(transaction=transaction) as pipe:
+            for name, *args in [commands[index] for index in pending] + invalidations:
+                getattr(pipe, name)(*args)
+            for index, value in zip(pending, await pipe.execute()):
+                results[index] = value
+                name, *args = commands[index]
+                if name == "get" and _l1_eligible(args[0]):
+                    _l1_put(args[0], value, epoch)
+        return results
+    except Exception as e:
+        logger.error(f"[Redis PIPELINE Error] Falha ao executar {len(commands)} comando(s) em lote: {e}")
+        return None
+
+def append_to_list_commands(key: str, values: list, *, trim_head: int = 0, max_items: int | None = None,
+                            ttl_seconds: int | None = None) -> list:
+    """
+    Monta os comandos de `append_to_list` para serem combinados com outros em um
+    mesmo `execute_batch`.
+    """
+    commands = [("rpush", key, *values)]
+    if trim_head:
+        commands.append(("ltrim", key, trim_head, -1))
+    if max_items:
+        commands.append(("ltrim", key, -max_items, -1))
+    if ttl_seconds:
+        commands.append(("expire", key, ttl_seconds))
+    return commands
+
+async def append_to_list(key: str, values: list, *, trim_head: int = 0, max_items: int | None = None,
+                         ttl_seconds: int | None = None) -> bool:
+    """
+    Adiciona valores ao final de uma lista e, na mesma transação (MULTI/EXEC),
+    remove `trim_head` itens do início, limita a lista aos `max_items` mais
+    recentes e renova o TTL.
+
+    Tudo vai ao servidor em uma única ida e volta, e nenhum outro cliente
+    consegue intercalar comandos no meio (ex: duas trocas de uma conversa
+    gravadas ao mesmo tempo ficam inteiras, uma depois da outra).
+    """
+    commands = append_to_list_commands(key, values, trim_head=trim_head, max_items=max_items, ttl_seconds=ttl_seconds)
+    return await execute_batch(commands, transaction=True) is not None
+
+# --- Gravação Condicional (cache-aside sem corrida) ---
+
+# Só grava o valor se a versão ainda for a lida antes da consulta à fonte.
+_SETEX_IF_VERSION_SCRIPT = """
+if (redis.call('get', KEYS[2]) or '0') == ARGV[3] then
+    redis.call('setex', KEYS[1], ARGV[1], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+async def setex_if_version(key: str, ttl_seconds: int, value: str, version_key: str, version: str | None) -> bool:
+    """
+    Grava `key` com TTL só se `version_key` ainda valer `version` (None = inexistente),
+    de forma atômica. Quem invalida o cache incrementa a versão: assim, um valor lido
+    da fonte antes da invalidação nunca sobrescreve o cache depois dela.
+    Retorna True se o valor foi gravado.
+    """
+    try:
+        r = await get_client()
+        written = await r.eval(_SETEX_IF_VERSION_SCRIPT, 2, key, version_key, ttl_seconds, value, version or '0')
+        if written:
+            _l1_drop(key)
+        return bool(written)
+    except Exception as e:
+        logger.error(f"[Redis SETEX Error] Falha ao definir a chave '{key}' (condicional): {e}")
+        return False
+
+# --- Locks e Notificações (coordenação entre réplicas do bot) ---
+
+# Só apaga o lock se ele ainda pertencer a quem o pegou.
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+async def acquire_lock(key: str, ttl_seconds: int) -> str | None:
+    """
+    Tenta pegar um lock (SET NX com expiração). Retorna o token do lock, ou None
+    se outro processo já o tiver. Se o Redis estiver fora, retorna um token mesmo
+    assim: quem chama segue sem coordenação em vez de travar.
+    """
+    token = uuid.uuid4().hex
+    try:
+        r = await get_client()
+        acquired = await r.set(key, token, nx=True, ex=ttl_seconds)
+        return token if acquired else None
+    except Exception as e:
+        logger.error(f"[Redis LOCK Error] Falha ao pegar o lock '{key}': {e}")
+        return token
+
+async def release_lock(key: str, token: str) -> bool:
+    """Libera um lock pego com `acquire_lock` (se ainda for do mesmo dono)."""
+    try:
+        r = await get_client()
+        return bool(await r.eval(_RELEASE_LOCK_SCRIPT, 1, key, token))
+    except Exception as e:
+        logger.error(f"[Redis LOCK Error] Falha ao liberar o lock '{key}': {e}")
+        return False
+
+async def publish(channel: str, message: str) -> bool:
+    """Publica uma mensagem em um canal pub/sub."""
+    try:
+        r = await get_client()
+        await r.publish(channel, message)
+        return True
+    except Exception as e:
+        logger.error(f"[Redis PUBLISH Error] Falha ao publicar no canal '{channel}': {e}")
+        return False
+
+async def count_subscribers(channel: str) -> int:
+    """Quantos clientes estão inscritos em um canal pub/sub (0 em caso de falha)."""
+    try:
+        r = await get_client()
+        [(_, count)] = await r.pubsub_numsub(channel)
+        return count
+    except Exception as e:
+        logger.error(f"[Redis NUMSUB Error] Falha ao contar inscritos no canal '{channel}': {e}")
+        return 0
+
+async def wait_for_message(channel: str, timeout: float, check=None) -> str | None:
+    """
+    Espera a primeira mensagem de um canal, por até `timeout` segundos.
+
+    `check` (corrotina opcional) é chamada logo depois da inscrição no canal: se
+    retornar algo, a espera termina com esse valor. Isso cobre o caso em que a
+    notificação foi publicada antes de a inscrição acontecer.
+    """
+    try:
+        r = await get_client()
+        async with r.pubsub() as pubsub:
+            await pubsub.subscribe(channel)
+            if check is not None:
+                result = await check()
+                if result is not None:
+                    return result
+            deadline = time.monotonic() + timeout
+            while (remaining := deadline - time.monotonic()) > 0:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=remaining)
+                if message is not None:
+                    return message["data"]
+            return None
+    except Exception as e:
+        logger.error(f"[Redis SUBSCRIBE Error] Falha ao esperar mensagem no canal '{channel}': {e}")
+        return None
+
 logger.info("Módulo de utilidades Redis carregado.")
 
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+"""
+Estado da Conversa por Usuário - AimiBOT
+
+Reúne, em um único objeto, tudo o que uma mensagem precisa saber sobre o
+usuário: a emoção atual da Aimi, o histórico da conversa e o resumo de longo
+prazo. Tudo é lido do Redis em uma única ida e
+volta no começo da mensagem; as alterações ficam pendentes no objeto e são
+gravadas juntas, em uma única transação, no fim.
+
+Os módulos que já sabem ler e gravar esses dados sozinhos (`llm.py`,
+`emotion.py`) continuam funcionando sem sessão; com uma sessão, eles usam o que
+já foi carregado e deixam as gravações para o `save`.
+"""
+
+import logging
+
+# --- Importações Locais ---
+import config
+from utils import redis as cache
+
+# --- Configuração do Logging ---
+logger = logging.getLogger(__name__)
+
+
+class ChatSession:
+    """Instantâneo do estado de um usuário, com as gravações pendentes."""
+
+    def __init__(self, user_id: int, emotion: str, history_items: list, summary: str):
+        self.user_id = user_id
+        self.emotion = emotion
+        # Itens crus da lista `aimi:history:{user_id}` (o `llm.py` interpreta o formato).
+        self.history_items = history_items
+        self.summary = summary
+        self._commands = []
+        self._on_saved = []
+
+    def set_emotion(self, emotion: str, ttl_seconds: int):
+        """Troca a emoção atual; a gravação acontece no `save`."""
+        self.emotion = emotion
+        self._commands.append(("setex", f"aimi:emotion:{self.user_id}", ttl_seconds, emotion))
+
+    def append_history(self, values: list, *, trim_head: int = 0, max_items: int | None = None,
+                       ttl_seconds: int | None = None, on_saved=None):
+        """
+        Agenda a gravação de novas falas no histórico (com corte e TTL).
+        `on_saved` é chamada depois que a gravação for confirmada.
+        """
+        self._commands += cache.append_to_list_commands(
+            f"aimi:history:{self.user_id}", values, trim_head=trim_head, max_items=max_items, ttl_seconds=ttl_seconds
+        )
+        if on_saved:
+            self._on_saved.append(on_saved)
+
+
+async def load(user_id: int) -> ChatSession:
+    """
+    Carrega emoção, histórico e resumo do usuário em uma única ida ao Redis.
+    (O acesso é verificado à parte, em paralelo: `pg.check_user_access`.)
+    """
+    results = await cache.execute_batch([
+        ("get", f"aimi:emotion:{user_id}"),
+        ("lrange", f"aimi:history:{user_id}", 0, -1),
+        ("get", f"aimi:summary:{user_id}")
+    ])
+    emotion, history_items, summary = results or (None, [], None)
+    return ChatSession(user_id, emotion or config.EMOTION_DEFAULT, history_items or [], summary or "")
+
+async def save(session: ChatSession) -> bool:
+    """Grava todas as alterações pendentes da sessão em uma única transação."""
+    commands, session._commands = session._commands, []
+    on_saved, session._on_saved = session._on_saved, []
+    if not commands:
+        return True
+
+    if await cache.execute_batch(commands, transaction=True) is None:
+        logger.error(f"[Session] Falha ao gravar o estado da conversa de {session.user_id}.")
+        return False
+    for callback in on_saved:
+        callback()
+    return True